@@ -31,8 +31,15 @@ def normalize(s: str) -> str:
 
 def validate_album(conn: sqlite3.Connection, artist: str, album: str, year: int | None) -> dict | None:
     """Search Spotify catalog for matching album."""
+    # Skip garbage input early: empty/near-empty strings would otherwise run
+    # the prefix strategy over huge index ranges ('' >= '' matches everything).
+    if len(album) < 2 or len(artist) < 2:
+        return None
+
     norm_artist = normalize(artist)
     norm_album = normalize(album)
+    if not norm_album:
+        return None
 
     best_match = None
     best_score = 0
@@ -77,16 +84,21 @@ def validate_album(conn: sqlite3.Connection, artist: str, album: str, year: int
         return best_match
 
     # Strategy 2: Prefix match on album (uses index)
-    album_prefix = album[:15] if len(album) > 15 else album
-    cursor = conn.execute("""
-        SELECT a.name, ar.name, a.release_date, a.rowid
-        FROM albums a
-        JOIN artist_albums aa ON a.rowid = aa.album_rowid
-        JOIN artists ar ON ar.rowid = aa.artist_rowid
-        WHERE aa.is_appears_on = 0
-        AND a.name >= ? AND a.name < ?
-        LIMIT 100
-    """, (album_prefix, album_prefix + 'zzz'))
+    # Only worthwhile for prefixes of 4+ chars; shorter ones devolve into
+    # index-range scans that match most of the table.
+    if len(album) >= 4:
+        album_prefix = album[:15] if len(album) > 15 else album
+        cursor = conn.execute("""
+            SELECT a.name, ar.name, a.release_date, a.rowid
+            FROM albums a
+            JOIN artist_albums aa ON a.rowid = aa.album_rowid
+            JOIN artists ar ON ar.rowid = aa.artist_rowid
+            WHERE aa.is_appears_on = 0
+            AND a.name >= ? AND a.name < ?
+            LIMIT 100
+        """, (album_prefix, album_prefix + 'zzz'))
+    else:
+        cursor = []
 
     for album_name, artist_name, release_date, album_rowid in cursor:
         album_sim = SequenceMatcher(None, norm_album, normalize(album_name)).ratio()
@@ -31,14 +31,29 @@ Usage:
 """
 
 import argparse
+import asyncio
+import functools
+import hashlib
 import json
+import queue
+from collections import defaultdict
 import random
 import sqlite3
-import urllib.request
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import time
 
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
@@ -98,11 +113,6 @@ def human_size(n):
     return f'{n:.1f}PB'
 
 
-def ensure_str(s):
-    """Ensure value is a string (handle bytes from SQLite)."""
-    return s.decode('utf-8', errors='replace') if isinstance(s, bytes) else s
-
-
 def normalize_response(response):
     """Normalize LLM response to valid category."""
     response = response.strip().lower()
@@ -128,8 +138,13 @@ def normalize_response(response):
 # PROMPT CONSTRUCTION
 # =============================================================================
 
+@functools.lru_cache(maxsize=200_000)
 def build_prompt(name, files_json):
-    """Build classification prompt with top 3 largest files."""
+    """Build classification prompt with top 3 largest files.
+
+    Memoized: in "all" mode the same (name, files_json) pair is formatted
+    once per model, and duplicate torrents repeat it again.
+    """
     files = json.loads(files_json) if files_json else []
     files_sorted = sorted(files, key=lambda x: x[0], reverse=True)[:3]
 
@@ -153,25 +168,28 @@ Category:"""
 # LLM CLASSIFICATION
 # =============================================================================
 
+# Shared keep-alive session for the threaded classify path: one TCP
+# connection per worker is reused across requests instead of paying a new
+# handshake per LLM call.
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
+
 def classify_ollama(prompt, model_name, timeout=60):
     """Classify using Ollama API (RTX)."""
-    data = json.dumps({
+    payload = {
         "model": model_name,
         "prompt": prompt,
         "stream": False,
         "options": {"temperature": 0.0, "num_predict": 20, "num_ctx": 2048}
-    }).encode()
+    }
 
     try:
-        req = urllib.request.Request(
-            f"{RTX_OLLAMA_URL}/api/generate",
-            data=data,
-            headers={"Content-Type": "application/json"}
-        )
         start = time.time()
-        with urllib.request.urlopen(req, timeout=timeout) as r:
-            result = json.loads(r.read())
-            response = result.get("response", "").strip().lower()
+        r = SESSION.post(f"{RTX_OLLAMA_URL}/api/generate", json=payload, timeout=timeout)
+        response = r.json().get("response", "").strip().lower()
         elapsed = time.time() - start
 
         normalized = normalize_response(response)
@@ -184,22 +202,71 @@ def classify_ollama(prompt, model_name, timeout=60):
 
 def classify_openai(prompt, timeout=60):
     """Classify using OpenAI API (Strix Halo - qwen3-coder)."""
-    data = json.dumps({
+    payload = {
         "prompt": prompt,
         "max_tokens": 10,
         "temperature": 0.0
-    }).encode()
+    }
+
+    try:
+        start = time.time()
+        r = SESSION.post(f"{STRIX_HALO_URL}/v1/completions", json=payload, timeout=timeout)
+        response = r.json().get("choices", [{}])[0].get("text", "").strip().lower()
+        elapsed = time.time() - start
+
+        normalized = normalize_response(response)
+        if normalized:
+            return normalized, elapsed
+        return f"?({response[:20]})", elapsed
+    except Exception as e:
+        return f"ERR({str(e)[:15]})", 0.0
+
+
+async def classify_ollama_async(session, prompt, model_name, timeout=60):
+    """Classify using Ollama API (RTX) over a shared aiohttp session."""
+    payload = {
+        "model": model_name,
+        "prompt": prompt,
+        "stream": False,
+        "options": {"temperature": 0.0, "num_predict": 20, "num_ctx": 2048}
+    }
 
     try:
-        req = urllib.request.Request(
-            f"{STRIX_HALO_URL}/v1/completions",
-            data=data,
-            headers={"Content-Type": "application/json"}
-        )
         start = time.time()
-        with urllib.request.urlopen(req, timeout=timeout) as r:
-            result = json.loads(r.read())
-            response = result.get("choices", [{}])[0].get("text", "").strip().lower()
+        async with session.post(
+            f"{RTX_OLLAMA_URL}/api/generate",
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as r:
+            result = await r.json()
+        response = result.get("response", "").strip().lower()
+        elapsed = time.time() - start
+
+        normalized = normalize_response(response)
+        if normalized:
+            return normalized, elapsed
+        return f"?({response[:20]})", elapsed
+    except Exception as e:
+        return f"ERR({str(e)[:15]})", 0.0
+
+
+async def classify_openai_async(session, prompt, timeout=60):
+    """Classify using OpenAI API (Strix Halo) over a shared aiohttp session."""
+    payload = {
+        "prompt": prompt,
+        "max_tokens": 10,
+        "temperature": 0.0
+    }
+
+    try:
+        start = time.time()
+        async with session.post(
+            f"{STRIX_HALO_URL}/v1/completions",
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as r:
+            result = await r.json()
+        response = result.get("choices", [{}])[0].get("text", "").strip().lower()
         elapsed = time.time() - start
 
         normalized = normalize_response(response)
@@ -214,11 +281,26 @@ def classify_openai(prompt, timeout=60):
 # DATABASE OPERATIONS
 # =============================================================================
 
+def apply_db_pragmas(conn):
+    """Tune a connection for concurrent labeling writes.
+
+    busy_timeout makes SQLite's C-level busy handler wait on contention
+    instead of raising OperationalError immediately; synchronous=NORMAL
+    halves the fsync cost per commit (safe under WAL).
+    """
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA wal_autocheckpoint=1000")
+
+
 def init_output_db():
     """Initialize output database with WAL mode for better concurrency."""
     OUTPUT_DB.parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(OUTPUT_DB)
-    conn.execute("PRAGMA journal_mode=WAL")
+    apply_db_pragmas(conn)
     conn.execute("""
         CREATE TABLE IF NOT EXISTS samples (
             id INTEGER PRIMARY KEY,
@@ -244,9 +326,131 @@ def init_output_db():
         conn.execute("ALTER TABLE samples ADD COLUMN qwen3coder_time REAL")
     except sqlite3.OperationalError:
         pass  # Columns already exist
+    # Exact-duplicate cache: mirrors/re-uploads produce identical prompts,
+    # so a hit skips a full LLM round-trip.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS labels_cache (
+            model TEXT NOT NULL,
+            prompt_sha1 BLOB NOT NULL,
+            label TEXT NOT NULL,
+            PRIMARY KEY (model, prompt_sha1)
+        )
+    """)
+    conn.commit()
+    return conn
+
+
+def ensure_indexes(conn):
+    """(Re)create the consensus/majority lookup indexes.
+
+    Kept out of init_output_db: the indexes are irrelevant while labeling
+    (only model columns are touched) but would still cost a B-tree probe on
+    every UPDATE of the indexed columns.
+    """
     conn.execute("CREATE INDEX IF NOT EXISTS idx_consensus ON samples(consensus)")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_majority ON samples(majority)")
     conn.commit()
+
+
+def load_labels_cache(model_name):
+    """Load the cached prompt->label map for one model into a dict."""
+    read_conn = open_reader()
+    try:
+        cache = dict(read_conn.execute(
+            "SELECT prompt_sha1, label FROM labels_cache WHERE model = ?",
+            (model_name,)
+        ).fetchall())
+    except sqlite3.OperationalError:
+        cache = {}  # Table may not exist in a pre-migration database
+    read_conn.close()
+    return cache
+
+
+def save_labels_cache(conn, entries):
+    """Persist newly cached (model, prompt_sha1, label) tuples."""
+    if not entries:
+        return
+    conn.executemany(
+        "INSERT OR IGNORE INTO labels_cache (model, prompt_sha1, label) VALUES (?, ?, ?)",
+        entries
+    )
+    conn.commit()
+
+
+# Batched writes: committing per row pays one fsync + WAL write lock per
+# labeled sample, which is what the old per-UPDATE retry loops were fighting.
+WRITE_BATCH_SIZE = 100
+WRITE_FLUSH_INTERVAL = 2.0
+
+
+def batched_writer(update_sql, result_queue):
+    """Writer thread: drain result tuples and flush them in batched transactions.
+
+    Flushes every WRITE_BATCH_SIZE rows or WRITE_FLUSH_INTERVAL seconds,
+    whichever comes first, so one fsync is amortized over many rows. Uses its
+    own connection (WAL allows concurrent readers). A None item signals
+    shutdown after a final flush.
+    """
+    # Larger statement cache + no tracing keeps the prepared UPDATE hot and
+    # trims Python-side overhead per batch; cache_spill=0 avoids mid-write
+    # page spills taking the lock longer than needed.
+    conn = sqlite3.connect(OUTPUT_DB, cached_statements=256)
+    conn.set_trace_callback(None)
+    apply_db_pragmas(conn)
+    conn.execute("PRAGMA cache_spill=0")
+    cur = conn.cursor()
+    pending = []
+    deadline = time.time() + WRITE_FLUSH_INTERVAL
+    done = False
+
+    while not done:
+        try:
+            item = result_queue.get(timeout=max(0.0, deadline - time.time()))
+            if item is None:
+                done = True
+            else:
+                pending.append(item)
+        except queue.Empty:
+            pass
+
+        if pending and (done or len(pending) >= WRITE_BATCH_SIZE or time.time() >= deadline):
+            # Retry on SQLite lock (rare now that busy_timeout waits natively)
+            for attempt in range(3):
+                try:
+                    cur.execute("BEGIN IMMEDIATE")
+                    cur.executemany(update_sql, pending)
+                    conn.commit()
+                    break
+                except sqlite3.OperationalError:
+                    conn.rollback()
+                    time.sleep(0.1 * (attempt + 1))
+            pending.clear()
+
+        if done or not pending:
+            deadline = time.time() + WRITE_FLUSH_INTERVAL
+
+    conn.close()
+
+
+def start_batched_writer(update_sql):
+    """Start a batched writer thread and return (queue, thread)."""
+    result_queue = queue.Queue(maxsize=1000)
+    writer = threading.Thread(
+        target=batched_writer, args=(update_sql, result_queue), daemon=True
+    )
+    writer.start()
+    return result_queue, writer
+
+
+def open_reader():
+    """Open a read-only connection to the output database.
+
+    Keeping reads on disposable read-only connections (single writer,
+    multiple readers) avoids a long-lived cursor pinning the writer
+    connection in a read transaction, which blocks WAL checkpointing.
+    """
+    conn = sqlite3.connect(f"file:{OUTPUT_DB}?mode=ro", uri=True)
+    conn.execute("PRAGMA busy_timeout=30000")
     return conn
 
 
@@ -262,40 +466,63 @@ def sample_torrents(n, existing_ids, seed=42):
     random.seed(seed)
 
     src_conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
-    src_conn.text_factory = bytes
-
-    cursor = src_conn.execute("SELECT MAX(id) FROM torrents")
-    max_id = cursor.fetchone()[0]
+    # Decode (with replacement for the dump's invalid UTF-8) inside SQLite's
+    # C-level text factory instead of a Python ensure_str call per column
+    src_conn.text_factory = lambda b: b.decode('utf-8', 'replace')
+
+    # Draw candidate ids in one C-level sample without replacement (2x
+    # overshoot covers gaps in the id space, already-processed ids and
+    # torrents without files; the surplus is a reserve consumed in draw
+    # order, so the result stays a uniform sample). Lookups run over a
+    # sorted copy so the chunked IN queries walk the B-tree mostly
+    # sequentially, and the draw stays seedable — ORDER BY RANDOM()
+    # would scan the whole table and ignore the seed.
+    max_id = src_conn.execute("SELECT MAX(id) FROM torrents").fetchone()[0]
+    draw = random.sample(range(1, max_id + 1), min(max_id, n * 2))
+    draw = [c for c in draw if c not in existing_ids]
+    candidates = sorted(draw)
+
+    picked = []
+    for i in range(0, len(candidates), 900):
+        chunk = candidates[i:i + 900]
+        placeholders = ",".join("?" * len(chunk))
+        picked.extend(src_conn.execute(
+            f"SELECT id, name, total_size FROM torrents WHERE id IN ({placeholders})",
+            chunk
+        ).fetchall())
+    picked_by_id = {row[0]: row for row in picked}
+
+    # Fetch all files for the selected ids in chunked IN queries (SQLite caps
+    # bound parameters at 999) instead of one query per torrent.
+    files_by_torrent = defaultdict(list)
+    ids = [row[0] for row in picked]
+    for i in range(0, len(ids), 900):
+        chunk = ids[i:i + 900]
+        placeholders = ",".join("?" * len(chunk))
+        cursor = src_conn.execute(
+            f"SELECT torrent_id, size, path FROM files WHERE torrent_id IN ({placeholders})",
+            chunk
+        )
+        for tid, size, path in cursor:
+            files_by_torrent[tid].append((size, path))
 
+    # Fill in draw order, not id order: taking the lowest ids of the
+    # overshoot would skew the sample toward old torrents
     torrents = []
-    attempts = 0
-    max_attempts = n * 10
-
-    while len(torrents) < n and attempts < max_attempts:
-        tid = random.randint(1, max_id)
-        attempts += 1
+    for tid in draw:
+        if len(torrents) >= n:
+            break
 
-        if tid in existing_ids:
+        row = picked_by_id.get(tid)
+        if row is None:
             continue
+        _, name, total_size = row
 
-        cursor = src_conn.execute(
-            "SELECT id, name, total_size FROM torrents WHERE id = ?", (tid,)
-        )
-        row = cursor.fetchone()
-        if not row:
-            continue
-
-        tid, name, total_size = row
-        cursor = src_conn.execute(
-            "SELECT size, path FROM files WHERE torrent_id = ?", (tid,)
-        )
-        files = cursor.fetchall()
-
+        files = files_by_torrent.get(tid)
         if not files:
             continue
 
-        name = ensure_str(name)
-        files_list = [[size, ensure_str(path)] for size, path in files[:10]]
+        files_list = [[size, path] for size, path in files[:10]]
 
         existing_ids.add(tid)
         torrents.append((tid, name, json.dumps(files_list), total_size))
@@ -309,66 +536,118 @@ def sample_torrents(n, existing_ids, seed=42):
 
 def insert_samples(conn, torrents):
     """Insert sampled torrents into output database."""
-    cursor = conn.cursor()
-    for tid, name, files_json, total_size in torrents:
-        cursor.execute(
-            "INSERT INTO samples (id, name, files_json, total_size) VALUES (?, ?, ?, ?)",
-            (tid, name, files_json, total_size)
-        )
+    # executemany binds in a C loop with one prepared statement, and
+    # BEGIN IMMEDIATE claims the write lock once for the whole batch.
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany(
+        "INSERT INTO samples (id, name, files_json, total_size) VALUES (?, ?, ?, ?)",
+        torrents
+    )
     conn.commit()
     print(f"Inserted {len(torrents)} samples")
 
 
-def label_with_model(conn, model_name, col_name, workers=4, use_openai=False):
-    """Label samples with a single model."""
-    cursor = conn.execute(
-        f"SELECT id, name, files_json FROM samples WHERE {col_name} IS NULL"
-    )
-    rows = cursor.fetchall()
+async def _label_rows_async(rows, update_sql, model_name, cache, workers, use_openai):
+    """Fan LLM calls out on one event loop with at most `workers` in flight.
 
-    if not rows:
-        print(f"  All samples already labeled with {model_name}")
-        return
+    Each in-flight request is a coroutine instead of an OS thread, so
+    concurrency scales without per-thread stacks or GIL churn on response
+    parsing. A single consumer coroutine owns the write connection and
+    batches UPDATEs, preserving the single-writer pattern.
 
-    api_type = "OpenAI (Strix Halo)" if use_openai else "Ollama (RTX)"
-    print(f"  Labeling {len(rows)} samples with {model_name} via {api_type} (workers={workers})...")
+    Returns the new (model, prompt_sha1, label) cache entries.
+    """
+    total = len(rows)
     start = time.time()
     completed = 0
+    cache_hits = 0
+    new_cache = []
+    result_queue = asyncio.Queue(maxsize=1000)
+    sem = asyncio.Semaphore(workers)
 
-    def process(row):
+    async def produce(session, row):
         sid, name, files_json = row
         prompt = build_prompt(name, files_json)
-        if use_openai:
-            label, elapsed = classify_openai(prompt)
-        else:
-            label, elapsed = classify_ollama(prompt, model_name)
-        return sid, label, elapsed
-
-    with ThreadPoolExecutor(max_workers=workers) as ex:
-        futures = {ex.submit(process, row): row for row in rows}
-        for future in as_completed(futures):
-            sid, label, elapsed = future.result()
-
-            # Retry on SQLite lock
-            for attempt in range(10):
-                try:
-                    conn.execute(
-                        f"UPDATE samples SET {col_name} = ?, {col_name}_time = ? WHERE id = ?",
-                        (label, elapsed, sid)
-                    )
-                    conn.commit()
-                    break
-                except sqlite3.OperationalError:
-                    time.sleep(0.1 * (attempt + 1))
+        prompt_sha1 = hashlib.sha1(prompt.encode()).digest()
+        cached = cache.get(prompt_sha1)
+        if cached is not None:
+            await result_queue.put((sid, cached, 0.0, None))
+            return
+        async with sem:
+            if use_openai:
+                label, elapsed = await classify_openai_async(session, prompt)
+            else:
+                label, elapsed = await classify_ollama_async(session, prompt, model_name)
+        await result_queue.put((sid, label, elapsed, prompt_sha1))
+
+    async def consume():
+        nonlocal completed, cache_hits
+        write_conn = sqlite3.connect(OUTPUT_DB, cached_statements=256)
+        apply_db_pragmas(write_conn)
+        pending = []
+        last_flush = time.time()
+
+        def flush():
+            nonlocal last_flush
+            if pending:
+                write_conn.execute("BEGIN IMMEDIATE")
+                write_conn.executemany(update_sql, pending)
+                write_conn.commit()
+                pending.clear()
+            last_flush = time.time()
+
+        while completed < total:
+            sid, label, elapsed, prompt_sha1 = await result_queue.get()
+            pending.append((label, elapsed, sid))
+
+            if prompt_sha1 is None:
+                cache_hits += 1
+            elif label in CATEGORIES:
+                new_cache.append((model_name, prompt_sha1, label))
 
             completed += 1
+            if len(pending) >= WRITE_BATCH_SIZE or time.time() - last_flush >= WRITE_FLUSH_INTERVAL:
+                flush()
             if completed % 100 == 0:
                 rate = completed / (time.time() - start)
-                remaining = (len(rows) - completed) / rate if rate > 0 else 0
-                print(f"    {completed}/{len(rows)} ({rate:.1f} req/s, ~{remaining/60:.1f}m left)")
+                remaining = (total - completed) / rate if rate > 0 else 0
+                print(f"    {completed}/{total} ({rate:.1f} req/s, ~{remaining/60:.1f}m left)")
+
+        flush()
+        write_conn.close()
+
+    connector = aiohttp.TCPConnector(limit=workers)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(consume(), *(produce(session, row) for row in rows))
 
     elapsed = time.time() - start
     print(f"    Done: {completed} samples in {elapsed:.1f}s ({completed/elapsed:.1f} req/s)")
+    if cache_hits:
+        print(f"    Cache hits: {cache_hits} (skipped LLM calls)")
+    return new_cache
+
+
+def label_with_model(conn, model_name, col_name, workers=4, use_openai=False):
+    """Label samples with a single model."""
+    read_conn = open_reader()
+    rows = read_conn.execute(
+        f"SELECT id, name, files_json FROM samples WHERE {col_name} IS NULL"
+    ).fetchall()
+    read_conn.close()
+
+    if not rows:
+        print(f"  All samples already labeled with {model_name}")
+        return
+
+    api_type = "OpenAI (Strix Halo)" if use_openai else "Ollama (RTX)"
+    print(f"  Labeling {len(rows)} samples with {model_name} via {api_type} (workers={workers})...")
+
+    cache = load_labels_cache(model_name)
+    update_sql = f"UPDATE samples SET {col_name} = ?, {col_name}_time = ? WHERE id = ?"
+    new_cache = asyncio.run(
+        _label_rows_async(rows, update_sql, model_name, cache, workers, use_openai)
+    )
+    save_labels_cache(conn, new_cache)
 
 
 def label_disagreements_with_qwen3coder(conn, workers=4, use_openai=True, batch="all"):
@@ -393,8 +672,9 @@ def label_disagreements_with_qwen3coder(conn, workers=4, use_openai=True, batch=
     elif batch == "even":
         base_query += " AND id % 2 = 0"
 
-    cursor = conn.execute(base_query)
-    rows = cursor.fetchall()
+    read_conn = open_reader()
+    rows = read_conn.execute(base_query).fetchall()
+    read_conn.close()
 
     if not rows:
         print(f"  No disagreements to label with qwen3-coder")
@@ -406,31 +686,36 @@ def label_disagreements_with_qwen3coder(conn, workers=4, use_openai=True, batch=
     start = time.time()
     completed = 0
 
+    cache = load_labels_cache(model_name)
+    new_cache = []
+    cache_hits = 0
+
     def process(row):
         sid, name, files_json = row
         prompt = build_prompt(name, files_json)
+        prompt_sha1 = hashlib.sha1(prompt.encode()).digest()
+        cached = cache.get(prompt_sha1)
+        if cached is not None:
+            return sid, cached, 0.0, None
         if use_openai:
             label, elapsed = classify_openai(prompt)
         else:
             label, elapsed = classify_ollama(prompt, "qwen3-coder:30b")
-        return sid, label, elapsed
+        return sid, label, elapsed, prompt_sha1
+
+    update_sql = "UPDATE samples SET qwen3coder = ?, qwen3coder_time = ? WHERE id = ?"
+    result_queue, writer = start_batched_writer(update_sql)
 
     with ThreadPoolExecutor(max_workers=workers) as ex:
         futures = {ex.submit(process, row): row for row in rows}
         for future in as_completed(futures):
-            sid, label, elapsed = future.result()
+            sid, label, elapsed, prompt_sha1 = future.result()
+            result_queue.put((label, elapsed, sid))
 
-            # Retry on SQLite lock
-            for attempt in range(10):
-                try:
-                    conn.execute(
-                        "UPDATE samples SET qwen3coder = ?, qwen3coder_time = ? WHERE id = ?",
-                        (label, elapsed, sid)
-                    )
-                    conn.commit()
-                    break
-                except sqlite3.OperationalError:
-                    time.sleep(0.1 * (attempt + 1))
+            if prompt_sha1 is None:
+                cache_hits += 1
+            elif label in CATEGORIES:
+                new_cache.append((model_name, prompt_sha1, label))
 
             completed += 1
             if completed % 100 == 0:
@@ -438,6 +723,12 @@ def label_disagreements_with_qwen3coder(conn, workers=4, use_openai=True, batch=
                 remaining = (len(rows) - completed) / rate if rate > 0 else 0
                 print(f"    {completed}/{len(rows)} ({rate:.1f} req/s, ~{remaining/60:.1f}m left)")
 
+    result_queue.put(None)
+    writer.join()
+    save_labels_cache(conn, new_cache)
+    if cache_hits:
+        print(f"    Cache hits: {cache_hits} (skipped LLM calls)")
+
     elapsed = time.time() - start
     print(f"    Done: {completed} samples in {elapsed:.1f}s ({completed/elapsed:.1f} req/s)")
 
@@ -448,7 +739,8 @@ def label_disagreements_dual(conn, rtx_workers=4, halo_workers=4):
     Main thread handles DB, workers only do HTTP requests.
     """
     # Get samples where all 3 small models have valid labels but don't all agree
-    cursor = conn.execute("""
+    read_conn = open_reader()
+    rows = read_conn.execute("""
         SELECT id, name, files_json FROM samples
         WHERE qwen IS NOT NULL AND gemma IS NOT NULL AND mistral IS NOT NULL
         AND qwen IN ('music','video','software','book','porn','other')
@@ -456,8 +748,8 @@ def label_disagreements_dual(conn, rtx_workers=4, halo_workers=4):
         AND mistral IN ('music','video','software','book','porn','other')
         AND qwen3coder IS NULL
         AND NOT (qwen = gemma AND gemma = mistral)
-    """)
-    rows = list(cursor.fetchall())
+    """).fetchall()
+    read_conn.close()
 
     if not rows:
         print(f"  No disagreements to label")
@@ -466,50 +758,69 @@ def label_disagreements_dual(conn, rtx_workers=4, halo_workers=4):
     total = len(rows)
     print(f"  Labeling {total} disagreements with qwen3-coder:30b via RTX ({rtx_workers}w) + Strix Halo ({halo_workers}w)...")
 
+    model_name = "qwen3-coder:30b"
+    cache = load_labels_cache(model_name)
+    new_cache = asyncio.run(
+        _label_disagreements_dual_async(rows, model_name, cache, rtx_workers, halo_workers)
+    )
+    save_labels_cache(conn, new_cache)
+
+
+async def _label_disagreements_dual_async(rows, model_name, cache, rtx_workers, halo_workers):
+    """Dual-endpoint fan-out: one event loop, one semaphore per endpoint.
+
+    Rows alternate between RTX (Ollama) and Strix Halo (OpenAI API) over a
+    shared session; a single consumer coroutine batches the DB writes.
+    """
+    total = len(rows)
     start = time.time()
     completed = 0
     rtx_count = 0
     halo_count = 0
+    new_cache = []
+    result_queue = asyncio.Queue(maxsize=1000)
+    rtx_sem = asyncio.Semaphore(rtx_workers)
+    halo_sem = asyncio.Semaphore(halo_workers)
 
-    def process_rtx(row):
-        sid, name, files_json = row
-        prompt = build_prompt(name, files_json)
-        label, elapsed = classify_ollama(prompt, "qwen3-coder:30b")
-        return sid, label, elapsed, "rtx"
-
-    def process_halo(row):
+    async def produce(session, row, source):
         sid, name, files_json = row
         prompt = build_prompt(name, files_json)
-        label, elapsed = classify_openai(prompt)
-        return sid, label, elapsed, "halo"
-
-    # Use two thread pools, main thread collects results
-    with ThreadPoolExecutor(max_workers=rtx_workers) as rtx_pool, \
-         ThreadPoolExecutor(max_workers=halo_workers) as halo_pool:
-
-        # Submit all work - alternate between pools to balance initially
-        futures = []
-        for i, row in enumerate(rows):
-            if i % 2 == 0:
-                futures.append(rtx_pool.submit(process_rtx, row))
-            else:
-                futures.append(halo_pool.submit(process_halo, row))
-
-        # Main thread collects results and writes to DB
-        for future in as_completed(futures):
-            sid, label, elapsed, source = future.result()
-
-            # Save to DB (main thread only)
-            for attempt in range(10):
-                try:
-                    conn.execute(
-                        "UPDATE samples SET qwen3coder = ?, qwen3coder_time = ? WHERE id = ?",
-                        (label, elapsed, sid)
-                    )
-                    conn.commit()
-                    break
-                except sqlite3.OperationalError:
-                    time.sleep(0.1 * (attempt + 1))
+        prompt_sha1 = hashlib.sha1(prompt.encode()).digest()
+        cached = cache.get(prompt_sha1)
+        if cached is not None:
+            await result_queue.put((sid, cached, 0.0, None, source))
+            return
+        if source == "rtx":
+            async with rtx_sem:
+                label, elapsed = await classify_ollama_async(session, prompt, model_name)
+        else:
+            async with halo_sem:
+                label, elapsed = await classify_openai_async(session, prompt)
+        await result_queue.put((sid, label, elapsed, prompt_sha1, source))
+
+    async def consume():
+        nonlocal completed, rtx_count, halo_count
+        write_conn = sqlite3.connect(OUTPUT_DB, cached_statements=256)
+        apply_db_pragmas(write_conn)
+        update_sql = "UPDATE samples SET qwen3coder = ?, qwen3coder_time = ? WHERE id = ?"
+        pending = []
+        last_flush = time.time()
+
+        def flush():
+            nonlocal last_flush
+            if pending:
+                write_conn.execute("BEGIN IMMEDIATE")
+                write_conn.executemany(update_sql, pending)
+                write_conn.commit()
+                pending.clear()
+            last_flush = time.time()
+
+        while completed < total:
+            sid, label, elapsed, prompt_sha1, source = await result_queue.get()
+            pending.append((label, elapsed, sid))
+
+            if prompt_sha1 is not None and label in CATEGORIES:
+                new_cache.append((model_name, prompt_sha1, label))
 
             completed += 1
             if source == "rtx":
@@ -517,14 +828,29 @@ def label_disagreements_dual(conn, rtx_workers=4, halo_workers=4):
             else:
                 halo_count += 1
 
+            if len(pending) >= WRITE_BATCH_SIZE or time.time() - last_flush >= WRITE_FLUSH_INTERVAL:
+                flush()
             if completed % 100 == 0:
                 rate = completed / (time.time() - start)
                 remaining = (total - completed) / rate if rate > 0 else 0
                 print(f"    {completed}/{total} ({rate:.1f} req/s, ~{remaining/60:.1f}m left) [RTX:{rtx_count} Halo:{halo_count}]")
 
+        flush()
+        write_conn.close()
+
+    # Alternate rows between endpoints to balance initially
+    connector = aiohttp.TCPConnector(limit=rtx_workers + halo_workers)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        producers = [
+            produce(session, row, "rtx" if i % 2 == 0 else "halo")
+            for i, row in enumerate(rows)
+        ]
+        await asyncio.gather(consume(), *producers)
+
     elapsed = time.time() - start
     print(f"    Done: {completed} samples in {elapsed:.1f}s ({completed/elapsed:.1f} req/s)")
     print(f"    RTX: {rtx_count}, Strix Halo: {halo_count}")
+    return new_cache
 
 
 def compute_consensus(conn):
@@ -533,65 +859,67 @@ def compute_consensus(conn):
     Handles two cases:
     1. All 3 small models agree -> consensus without needing qwen3coder
     2. Disagreement with qwen3coder -> use majority voting
-    """
-    from collections import Counter
-    cursor = conn.cursor()
 
-    # Get all samples with at least 3 small model labels
-    cursor.execute("""
-        SELECT id, qwen, gemma, mistral, qwen3coder FROM samples
+    Both rules are set-oriented, so they run as two UPDATEs inside SQLite's
+    engine instead of a Python row loop issuing one UPDATE per sample.
+    """
+    cat_list = ", ".join(f"'{c}'" for c in CATEGORIES)
+
+    # Bulk-update pattern: drop the indexes on the columns being rewritten,
+    # recreate them once afterwards instead of maintaining them row by row.
+    conn.execute("DROP INDEX IF EXISTS idx_consensus")
+    conn.execute("DROP INDEX IF EXISTS idx_majority")
+
+    # Pass 1: unanimous (and valid) small models -> consensus + majority.
+    # Every other row with 3 small labels is reset to NULL before pass 2.
+    conn.execute(f"""
+        UPDATE samples SET
+            consensus = CASE
+                WHEN qwen = gemma AND gemma = mistral AND qwen IN ({cat_list})
+                THEN qwen END,
+            majority = CASE
+                WHEN qwen = gemma AND gemma = mistral AND qwen IN ({cat_list})
+                THEN qwen END
         WHERE qwen IS NOT NULL AND gemma IS NOT NULL AND mistral IS NOT NULL
     """)
 
-    for row in cursor.fetchall():
-        sid, qwen, gemma, mistral, qwen3coder = row
-
-        # Filter valid small model labels
-        small_labels = [l for l in [qwen, gemma, mistral] if l in CATEGORIES]
-
-        consensus = None
-        majority = None
-
-        if len(small_labels) == 3:
-            if small_labels[0] == small_labels[1] == small_labels[2]:
-                # All 3 small models agree - consensus!
-                consensus = small_labels[0]
-                majority = small_labels[0]
-            elif qwen3coder and qwen3coder in CATEGORIES:
-                # Disagreement among small models, use qwen3coder to break tie
-                all_labels = small_labels + [qwen3coder]
-                counts = Counter(all_labels)
-                most_common = counts.most_common(1)[0]
-                if most_common[1] >= 3:
-                    # 3v1 split - use majority
-                    majority = most_common[0]
-                elif most_common[1] == 2:
-                    # Check for 2v2 vs 2v1v1
-                    top_two = counts.most_common(2)
-                    if len(top_two) >= 2 and top_two[1][1] == 2:
-                        # 2v2 split - no clear majority
-                        majority = None
-                    else:
-                        # 2v1v1 - use the 2
-                        majority = most_common[0]
-
-        conn.execute(
-            "UPDATE samples SET consensus = ?, majority = ? WHERE id = ?",
-            (consensus, majority, sid)
-        )
+    # Pass 2: small models disagree and qwen3coder is valid. Three small
+    # votes leave either a 2+1 pair or three distinct labels:
+    # - pair, qwen3coder sides with the singleton -> 2v2, no majority
+    # - pair otherwise -> pair wins (3v1 or 2v1v1)
+    # - all distinct -> qwen3coder matching any small label makes a 2v1v1
+    conn.execute(f"""
+        UPDATE samples SET majority = CASE
+            WHEN qwen = gemma THEN
+                CASE WHEN qwen3coder = mistral THEN NULL ELSE qwen END
+            WHEN qwen = mistral THEN
+                CASE WHEN qwen3coder = gemma THEN NULL ELSE qwen END
+            WHEN gemma = mistral THEN
+                CASE WHEN qwen3coder = qwen THEN NULL ELSE gemma END
+            WHEN qwen3coder IN (qwen, gemma, mistral) THEN qwen3coder
+            ELSE NULL
+        END
+        WHERE qwen IN ({cat_list}) AND gemma IN ({cat_list})
+          AND mistral IN ({cat_list})
+          AND NOT (qwen = gemma AND gemma = mistral)
+          AND qwen3coder IN ({cat_list})
+    """)
 
     conn.commit()
+    ensure_indexes(conn)
 
 
 def print_stats(conn):
     """Print labeling statistics."""
-    cursor = conn.cursor()
+    read_conn = open_reader()
+    cursor = read_conn.cursor()
 
     cursor.execute("SELECT COUNT(*) FROM samples")
     total = cursor.fetchone()[0]
 
     if total == 0:
         print("No samples in database")
+        read_conn.close()
         return
 
     # Count samples with all 4 labels
@@ -645,6 +973,8 @@ def print_stats(conn):
             summary = " ".join(f"{k}:{v}" for k, v in sorted(dist.items()))
             print(f"  {col:12}: {summary}")
 
+    read_conn.close()
+
 
 def export_training_data(conn, output_file, use_majority=True):
     """Export labeled data for BERT training.
@@ -653,31 +983,46 @@ def export_training_data(conn, output_file, use_majority=True):
     """
     label_col = "majority" if use_majority else "consensus"
 
-    cursor = conn.execute(f"""
+    read_conn = open_reader()
+    cursor = read_conn.execute(f"""
         SELECT name, files_json, {label_col} FROM samples
         WHERE {label_col} IS NOT NULL
     """)
+    cursor.arraysize = 1024
+
+    # One encoder instance instead of a json.dumps setup per row
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
 
     count = 0
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for name, files_json, label in cursor:
-            # Parse files and get top 3 biggest
-            try:
-                files = json.loads(files_json) if files_json else []
-            except json.JSONDecodeError:
-                files = []
-
-            # Build text: name + top 3 file names
-            # files format: [[size, filename], [size, filename], ...]
-            if files:
-                top_file_names = [f[1] for f in files[:3]]
-                text = f"{name} | {' | '.join(top_file_names)}"
-            else:
-                text = name
 
-            f.write(json.dumps({"text": text, "label": label}, ensure_ascii=False) + '\n')
-            count += 1
+    def lines():
+        nonlocal count
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                return
+            for name, files_json, label in rows:
+                # Parse files and get top 3 biggest
+                try:
+                    files = _json_loads(files_json) if files_json else []
+                except ValueError:
+                    files = []
+
+                # Build text: name + top 3 file names
+                # files format: [[size, filename], [size, filename], ...]
+                if files:
+                    top_file_names = [f[1] for f in files[:3]]
+                    text = f"{name} | {' | '.join(top_file_names)}"
+                else:
+                    text = name
+
+                count += 1
+                yield encode({"text": text, "label": label}) + '\n'
+
+    with open(output_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        f.writelines(lines())
 
+    read_conn.close()
     print(f"Exported {count} samples to {output_file}")
 
 
@@ -17,6 +17,8 @@ def main():
     parser = argparse.ArgumentParser(description="Convert BERT classifier to ONNX")
     parser.add_argument("--nsfw", action="store_true", help="Convert NSFW classifier")
     parser.add_argument("--model-dir", type=Path, help="Override model directory")
+    parser.add_argument("--warmup-batch", type=int, default=32,
+                        help="Batch size for the batched warmup run (0 to skip)")
     args = parser.parse_args()
 
     if args.nsfw:
@@ -43,12 +45,21 @@ def main():
     dummy_text = "test input"
     inputs = tokenizer(dummy_text, return_tensors="pt", truncation=True, max_length=128)
 
-    # Export to ONNX
+    # Trace and pre-optimize before export: folds dropout/training branches
+    # and constant embedding lookups out of the graph.
+    print("Tracing model...")
+    traced = torch.jit.trace(
+        model, (inputs["input_ids"], inputs["attention_mask"]), strict=False
+    )
+    traced = torch.jit.optimize_for_inference(traced)
+
+    # Export to ONNX. Opset 17 emits LayerNormalization/Gelu as single ops
+    # that onnxruntime runs as one fused kernel each.
     onnx_path = onnx_dir / "model.onnx"
     print(f"Exporting to {onnx_path}...")
 
     torch.onnx.export(
-        model,
+        traced,
         (inputs["input_ids"], inputs["attention_mask"]),
         onnx_path,
         input_names=["input_ids", "attention_mask"],
@@ -58,15 +69,37 @@ def main():
             "attention_mask": {0: "batch", 1: "sequence"},
             "logits": {0: "batch"},
         },
-        opset_version=14,
+        opset_version=17,
+        do_constant_folding=True,
     )
 
+    # Fuse the BERT graph (attention/LayerNorm/Gelu into single kernels) and
+    # quantize weights to INT8: ~4x smaller artifact and int8-dot matmuls in
+    # ORT's CPU kernels on AVX2/VNNI hosts.
+    print("Optimizing graph (BERT fusion)...")
+    from onnxruntime.transformers.optimizer import optimize_model
+
+    opt = optimize_model(
+        str(onnx_path),
+        model_type="bert",
+        num_heads=model.config.num_attention_heads,
+        hidden_size=model.config.hidden_size,
+    )
+    opt_path = onnx_dir / "model_opt.onnx"
+    opt.save_model_to_file(str(opt_path))
+
+    print("Quantizing to INT8...")
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    int8_path = onnx_dir / "model_int8.onnx"
+    quantize_dynamic(str(opt_path), str(int8_path), weight_type=QuantType.QInt8)
+
     # Also create embedded version for Rust (merges external data into single file)
     print("Creating embedded version for Rust...")
     import onnx
     from onnx.external_data_helper import load_external_data_for_model
 
-    model_onnx = onnx.load(str(onnx_path))
+    model_onnx = onnx.load(str(int8_path))
     # Load any external data that may have been created
     try:
         load_external_data_for_model(model_onnx, str(onnx_dir))
@@ -100,24 +133,43 @@ def main():
 
     # Test with onnxruntime
     print("\nTesting ONNX model with onnxruntime...")
-    import onnxruntime as ort
+    import os
     import numpy as np
+    import onnxruntime as ort
+    from scipy.special import softmax
 
-    session = ort.InferenceSession(str(onnx_path))
+    sess_options = ort.SessionOptions()
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    sess_options.intra_op_num_threads = os.cpu_count()
+    session = ort.InferenceSession(str(embedded_path), sess_options)
 
     inputs = tokenizer(test_input, return_tensors="np", truncation=True, max_length=128)
 
+    # Batched warmup: exercises the dynamic batch axis and caches ORT's
+    # shape-specialized kernels before the timed single-sample run
+    if args.warmup_batch > 0:
+        print(f"  Warmup with batch of {args.warmup_batch}...")
+        session.run(
+            None,
+            {
+                "input_ids": np.tile(inputs["input_ids"], (args.warmup_batch, 1)),
+                "attention_mask": np.tile(inputs["attention_mask"], (args.warmup_batch, 1)),
+            },
+        )
+
     outputs = session.run(
         None,
         {"input_ids": inputs["input_ids"], "attention_mask": inputs["attention_mask"]},
     )
 
     logits = outputs[0]
-    probs = np.exp(logits) / np.exp(logits).sum(axis=-1, keepdims=True)
-    pred_id = probs.argmax()
+    # argmax is softmax-invariant; softmax (single numerically-stable pass)
+    # is only needed for the reported probability
+    pred_id = int(logits.argmax())
+    prob = softmax(logits, axis=-1)[0, pred_id]
 
     print(f"  Input: {test_input[:50]}...")
-    print(f"  Prediction: {id2label[pred_id]} ({probs[0][pred_id]:.1%})")
+    print(f"  Prediction: {id2label[pred_id]} ({prob:.1%})")
 
     print("\nDone!")
 
@@ -2,22 +2,86 @@
 """Extract album name matching pairs from MusicBrainz JSON dump."""
 
 import json
+import lzma
 import random
 import re
+import shutil
+import subprocess
 import tarfile
 from pathlib import Path
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _dumps_line(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+except ImportError:
+    _json_loads = json.loads
+
+    def _dumps_line(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8') + b'\n'
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
 # Stream directly from compressed archive
 RELEASE_GROUP_ARCHIVE = Path(__file__).parent.parent / "release-group.tar.xz"
 OUTPUT_FILE = Path(__file__).parent.parent / "data" / "album_pairs.jsonl"
 
 TARGET_POSITIVE = 5000
 TARGET_NEGATIVE = 5000
+NEG_POOL_SIZE = 200000  # Titles kept for negative-pair sampling
+
+# Precompiled once: these run millions of times in the extraction loop and
+# re.sub with a string pattern pays a cache lookup on every call.
+_NORMALIZE_RE = re.compile(r'[^\w\s]')
+_PUNCT_RE = re.compile(r"['\-\.\:\,]")
+_SUFFIX_RES = tuple(re.compile(p, re.IGNORECASE) for p in [
+    r'\s*\(Remastered\)',
+    r'\s*\(Deluxe.*?\)',
+    r'\s*\[Remaster\]',
+    r'\s*-\s*Deluxe',
+    r'\s*\(.*?Edition\)',
+])
+
+
+def open_archive_stream(archive: Path) -> tarfile.TarFile:
+    """Open a tar.xz as a sequential stream.
+
+    Prefers the xz binary with threaded decode (-T 0), which decompresses
+    on all cores while Python parses; falls back to in-process lzma.
+    """
+    if shutil.which('xz'):
+        proc = subprocess.Popen(
+            ['xz', '-dc', '-T', '0', str(archive)],
+            stdout=subprocess.PIPE, bufsize=1 << 20,
+        )
+        return tarfile.open(fileobj=proc.stdout, mode='r|')
+    return tarfile.open(fileobj=lzma.open(archive, 'rb'), mode='r|')
 
 
 def normalize(name: str) -> str:
     """Normalize name for comparison."""
-    return re.sub(r'[^\w\s]', '', name.lower()).strip()
+    return _NORMALIZE_RE.sub('', name.lower()).strip()
+
+
+def normalize_batch(names: list[str]) -> list[str]:
+    """Normalize many names at once, in native code when pyarrow is present.
+
+    The RE2 class mirrors Python's unicode-aware \\w as [\\p{L}\\p{N}_].
+    """
+    if pa is not None:
+        arr = pc.utf8_trim_whitespace(
+            pc.replace_substring_regex(
+                pc.utf8_lower(pa.array(names)), r'[^\p{L}\p{N}_\s]', ''
+            )
+        )
+        return arr.to_pylist()
+    return [normalize(n) for n in names]
 
 
 def generate_synthetic_variation(title: str) -> str | None:
@@ -37,7 +101,7 @@ def generate_synthetic_variation(title: str) -> str | None:
         variations.append("The " + title)
 
     # Remove punctuation
-    no_punct = re.sub(r"['\-\.\:\,]", "", title)
+    no_punct = _PUNCT_RE.sub("", title)
     if no_punct != title:
         variations.append(no_punct)
 
@@ -52,14 +116,8 @@ def generate_synthetic_variation(title: str) -> str | None:
     variations.append(title + random.choice(suffixes))
 
     # Remove common suffixes
-    for suffix_pattern in [
-        r'\s*\(Remastered\)',
-        r'\s*\(Deluxe.*?\)',
-        r'\s*\[Remaster\]',
-        r'\s*-\s*Deluxe',
-        r'\s*\(.*?Edition\)',
-    ]:
-        cleaned = re.sub(suffix_pattern, '', title, flags=re.IGNORECASE)
+    for suffix_re in _SUFFIX_RES:
+        cleaned = suffix_re.sub('', title)
         if cleaned != title:
             variations.append(cleaned.strip())
 
@@ -69,13 +127,16 @@ def generate_synthetic_variation(title: str) -> str | None:
 def extract_pairs():
     """Extract album name pairs from the dump."""
     positive_pairs = []
-    all_titles = []
+    pool = []  # Fixed-size reservoir of titles for negative sampling
+    titles_seen = 0
 
     print(f"Streaming from {RELEASE_GROUP_ARCHIVE}...")
 
-    with tarfile.open(RELEASE_GROUP_ARCHIVE, 'r:xz') as tar:
+    # Stream mode ('r|') reads the tar sequentially as it decompresses, so we
+    # don't pay a full archive walk in getmembers() before the first line.
+    with open_archive_stream(RELEASE_GROUP_ARCHIVE) as tar:
         # Find the release-group file in the archive
-        for member in tar.getmembers():
+        for member in tar:
             if 'release-group' in member.name and not member.isdir():
                 print(f"  Found: {member.name} ({member.size:,} bytes)")
                 f = tar.extractfile(member)
@@ -89,26 +150,39 @@ def extract_pairs():
                 print(f"  Processed {i:,} release groups, found {len(positive_pairs):,} positive pairs")
 
             try:
-                rg = json.loads(line.decode('utf-8'))
-            except (json.JSONDecodeError, UnicodeDecodeError):
+                rg = _json_loads(line)
+            except (ValueError, UnicodeDecodeError):
                 continue
 
             title = rg.get('title', '').strip()
             if not title:
                 continue
 
-            all_titles.append(title)
+            # Reservoir sampling keeps a uniform NEG_POOL_SIZE-title sample
+            # at O(pool) memory instead of holding every title resident.
+            titles_seen += 1
+            if len(pool) < NEG_POOL_SIZE:
+                pool.append(title)
+            else:
+                j = random.randint(0, titles_seen - 1)
+                if j < NEG_POOL_SIZE:
+                    pool[j] = title
+
             aliases = rg.get('aliases', [])
 
-            # Create positive pairs from aliases
-            for alias in aliases:
-                alias_name = alias.get('name', '').strip()
-                if alias_name and normalize(alias_name) != normalize(title):
-                    positive_pairs.append({
-                        'name1': title,
-                        'name2': alias_name,
-                        'match': True
-                    })
+            # Create positive pairs from aliases (collect 2x the target so
+            # the later down-sample keeps some variety)
+            if aliases and len(positive_pairs) < TARGET_POSITIVE * 2:
+                # Normalize the title once per record, not once per alias
+                norm_title = normalize(title)
+                for alias in aliases:
+                    alias_name = alias.get('name', '').strip()
+                    if alias_name and normalize(alias_name) != norm_title:
+                        positive_pairs.append({
+                            'name1': title,
+                            'name2': alias_name,
+                            'match': True
+                        })
 
             # Generate synthetic variation
             if len(positive_pairs) < TARGET_POSITIVE:
@@ -120,7 +194,12 @@ def extract_pairs():
                         'match': True
                     })
 
-    print(f"Found {len(positive_pairs):,} positive pairs from {len(all_titles):,} release groups")
+            # Once positives and the sampling pool are both full, the rest
+            # of the multi-GB archive adds nothing.
+            if len(positive_pairs) >= TARGET_POSITIVE * 2 and len(pool) >= NEG_POOL_SIZE:
+                break
+
+    print(f"Found {len(positive_pairs):,} positive pairs from {titles_seen:,} release groups")
 
     # Limit positive pairs
     if len(positive_pairs) > TARGET_POSITIVE:
@@ -128,18 +207,22 @@ def extract_pairs():
 
     # Generate negative pairs
     print("Generating negative pairs...")
+    # Normalize the pool once up front; the rejection test is then two list
+    # lookups per attempt instead of two regex substitutions.
+    norm_titles = normalize_batch(pool)
     negative_pairs = []
     attempts = 0
     max_attempts = TARGET_NEGATIVE * 10
 
     while len(negative_pairs) < TARGET_NEGATIVE and attempts < max_attempts:
         attempts += 1
-        title1, title2 = random.sample(all_titles, 2)
+        i = random.randrange(len(pool))
+        j = random.randrange(len(pool))
 
-        if normalize(title1) != normalize(title2):
+        if i != j and norm_titles[i] != norm_titles[j]:
             negative_pairs.append({
-                'name1': title1,
-                'name2': title2,
+                'name1': pool[i],
+                'name2': pool[j],
                 'match': False
             })
 
@@ -151,9 +234,8 @@ def extract_pairs():
 
     # Write output
     OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        for pair in all_pairs:
-            f.write(json.dumps(pair, ensure_ascii=False) + '\n')
+    with open(OUTPUT_FILE, 'wb', buffering=1 << 20) as f:
+        f.writelines(_dumps_line(pair) for pair in all_pairs)
 
     print(f"Wrote {len(all_pairs):,} pairs to {OUTPUT_FILE}")
 
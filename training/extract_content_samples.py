@@ -1,12 +1,25 @@
 #!/usr/bin/env python3
 """Extract content type samples from Magnetico database for BERT classifier training."""
 
+import itertools
 import json
 import random
 import re
 import sqlite3
+
+import numpy as np
 from pathlib import Path
-from collections import defaultdict
+from collections import Counter, defaultdict
+from operator import itemgetter
+
+try:
+    import orjson
+
+    def _dumps_line(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+except ImportError:
+    def _dumps_line(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8') + b'\n'
 
 DB_PATH = Path.home() / "Downloads/dht-magnetico-dump/32.5M-BitTorrent-DHT-Dump-Magnetico-Maiti.info/database.sqlite3"
 OUTPUT_FILE = Path(__file__).parent.parent / "data" / "content_classifier.jsonl"
@@ -26,7 +39,6 @@ ADULT_PATTERNS = [
     r'\bhentai\b', r'\bjav\b', r'\bbrazzers\b', r'\bbangbros\b', r'\bnaughty',
     r'\bmilf\b', r'\blezb', r'\bgay\s*porn', r'\bfetish', r'\bplayboy\b',
 ]
-ADULT_RE = re.compile('|'.join(ADULT_PATTERNS), re.IGNORECASE)
 
 # Movie/TV patterns
 MOVIE_PATTERNS = [
@@ -34,7 +46,6 @@ MOVIE_PATTERNS = [
     r'\b(x264|x265|hevc|h\.?264|h\.?265)\b', r'\bS\d{2}E\d{2}\b',  # S01E01
     r'\b(complete\s*series|season\s*\d+)\b',
 ]
-MOVIE_RE = re.compile('|'.join(MOVIE_PATTERNS), re.IGNORECASE)
 
 # Software patterns
 SOFTWARE_PATTERNS = [
@@ -42,7 +53,17 @@ SOFTWARE_PATTERNS = [
     r'\b(setup|install|windows|linux|macos|android)\b',
     r'\bv?\d+\.\d+\.\d+\b',  # Version numbers like v1.2.3
 ]
-SOFTWARE_RE = re.compile('|'.join(SOFTWARE_PATTERNS), re.IGNORECASE)
+
+# Single fused alternation: one scan over the name yields which pattern
+# families matched (via lastgroup) instead of three separate re.search passes.
+CATEGORY_RE = re.compile(
+    '|'.join([
+        f"(?P<adult>{'|'.join(ADULT_PATTERNS)})",
+        f"(?P<movie>{'|'.join(MOVIE_PATTERNS)})",
+        f"(?P<software>{'|'.join(SOFTWARE_PATTERNS)})",
+    ]),
+    re.IGNORECASE,
+)
 
 
 def build_tree(files: list[tuple[int, str | bytes]]) -> str:
@@ -55,28 +76,12 @@ def build_tree(files: list[tuple[int, str | bytes]]) -> str:
     return '\n'.join(lines)
 
 
-def count_extensions(files: list[tuple[int, str | bytes]]) -> dict[str, int]:
-    """Count file extensions in a torrent."""
-    counts = defaultdict(int)
-    for _, path in files:
-        if isinstance(path, bytes):
-            path = path.decode('utf-8', errors='replace')
-        ext = Path(path).suffix.lower()
-        if ext:
-            counts[ext] += 1
-    return dict(counts)
-
-
-def get_total_size_by_ext(files: list[tuple[int, str | bytes]], extensions: set) -> int:
-    """Get total size of files matching given extensions."""
-    total = 0
-    for size, path in files:
-        if isinstance(path, bytes):
-            path = path.decode('utf-8', errors='replace')
-        ext = Path(path).suffix.lower()
-        if ext in extensions:
-            total += size
-    return total
+def file_ext(path: str) -> str:
+    """Lowercased extension of the final path component, '' if none."""
+    head, sep, tail = path.rpartition('.')
+    if sep and tail and '/' not in tail:
+        return '.' + tail.lower()
+    return ''
 
 
 def classify_torrent(name: str | bytes, files: list[tuple[int, str]], total_size: int) -> str | None:
@@ -88,39 +93,52 @@ def classify_torrent(name: str | bytes, files: list[tuple[int, str]], total_size
     if isinstance(name, bytes):
         name = name.decode('utf-8', errors='replace')
     name_lower = name.lower()
-    ext_counts = count_extensions(files)
+    # One pass over the name; each match reports its pattern family.
+    name_hits = {m.lastgroup for m in CATEGORY_RE.finditer(name)}
     total_files = len(files)
 
     if total_files == 0:
         return None
 
+    # Decode each path and derive its extension exactly once; every predicate
+    # below works off these parallel lists instead of re-walking the file list.
+    decoded = [
+        (size, p if isinstance(p, str) else p.decode('utf-8', errors='replace'))
+        for size, p in files
+    ]
+    exts = [file_ext(p) for _, p in decoded]
+    ext_counts = Counter(exts)
+    del ext_counts['']  # Files without an extension don't count
+
     # Count files by category
     audio_count = sum(ext_counts.get(ext, 0) for ext in AUDIO_EXTENSIONS)
     video_count = sum(ext_counts.get(ext, 0) for ext in VIDEO_EXTENSIONS)
     software_count = sum(ext_counts.get(ext, 0) for ext in SOFTWARE_EXTENSIONS)
     book_count = sum(ext_counts.get(ext, 0) for ext in BOOK_EXTENSIONS)
 
-    audio_pct = audio_count / total_files if total_files > 0 else 0
-    video_pct = video_count / total_files if total_files > 0 else 0
+    # Ratio thresholds below are integer cross-multiplies (e.g. a/t > 0.5
+    # becomes a*2 > t), keeping the hot path free of float division.
 
     # Adult content: check name patterns first
-    if ADULT_RE.search(name):
+    if 'adult' in name_hits:
         # Confirm with video files
         if video_count > 0 or '.jpg' in ext_counts or '.jpeg' in ext_counts:
             return 'porn'
 
     # Music: mostly audio files, multiple tracks
-    if audio_pct > 0.5 and audio_count >= 3:
+    if audio_count * 2 > total_files and audio_count >= 3:
         # Not a movie with soundtrack
         if video_count == 0:
             return 'music'
 
     # Movie/TV: video files with typical naming patterns
     if video_count > 0:
-        video_size = get_total_size_by_ext(files, VIDEO_EXTENSIONS)
+        video_size = sum(
+            size for (size, _), ext in zip(decoded, exts) if ext in VIDEO_EXTENSIONS
+        )
         # Video should be majority of content
-        if video_size > total_size * 0.7:
-            if MOVIE_RE.search(name):
+        if video_size * 10 > total_size * 7:
+            if 'movie' in name_hits:
                 return 'movie'
             # Large video files without specific patterns
             if video_count <= 3 and video_size > 500 * 1024 * 1024:  # >500MB
@@ -128,7 +146,7 @@ def classify_torrent(name: str | bytes, files: list[tuple[int, str]], total_size
 
     # Software: executables, ISOs, or software naming patterns
     if software_count > 0:
-        if SOFTWARE_RE.search(name):
+        if 'software' in name_hits:
             return 'software'
         # ISOs are usually software
         if ext_counts.get('.iso', 0) > 0:
@@ -136,9 +154,8 @@ def classify_torrent(name: str | bytes, files: list[tuple[int, str]], total_size
 
     # Books: ebook formats
     if book_count > 0:
-        book_pct = book_count / total_files
         # Mostly books, or clear ebook collection
-        if book_pct > 0.5 or (book_count >= 3 and 'ebook' in name_lower):
+        if book_count * 2 > total_files or (book_count >= 3 and 'ebook' in name_lower):
             return 'book'
         # Single PDF could be book or document
         if book_count == 1 and ext_counts.get('.pdf', 0) == 1:
@@ -146,10 +163,10 @@ def classify_torrent(name: str | bytes, files: list[tuple[int, str]], total_size
                 return 'book'
 
     # Fallback checks
-    if audio_pct > 0.3 and audio_count >= 3:
+    if audio_count * 10 > total_files * 3 and audio_count >= 3:
         return 'music'
 
-    if video_count > 0 and video_pct > 0.3:
+    if video_count > 0 and video_count * 10 > total_files * 3:
         return 'movie'
 
     return 'other'
@@ -170,12 +187,17 @@ def get_sample_torrents(conn: sqlite3.Connection, limit_per_scan: int = 50000) -
     batch_size = 10000
     attempts = 0
     max_attempts = 50  # Prevent infinite loops
+    rng = np.random.default_rng(42)
 
     while sum(len(v) for v in samples.values()) < target_total and attempts < max_attempts:
         attempts += 1
 
-        # Get random batch of IDs
-        random_ids = random.sample(range(1, max_id + 1), min(batch_size, max_id))
+        # Get random batch of IDs, deduplicated and sorted: sorted ids walk
+        # the torrents/files B-trees mostly sequentially instead of hopping
+        # between random pages.
+        random_ids = np.unique(
+            rng.integers(1, max_id + 1, size=min(batch_size, max_id))
+        ).tolist()
         placeholders = ','.join('?' * len(random_ids))
 
         cursor = conn.execute(f"""
@@ -186,6 +208,19 @@ def get_sample_torrents(conn: sqlite3.Connection, limit_per_scan: int = 50000) -
 
         torrents = cursor.fetchall()
 
+        # One files query per batch instead of one per torrent; rows come
+        # back ordered so they group cleanly per torrent id.
+        file_cursor = conn.execute(f"""
+            SELECT torrent_id, size, path
+            FROM files
+            WHERE torrent_id IN ({placeholders})
+            ORDER BY torrent_id, path
+        """, random_ids)
+        files_by_tid = {
+            tid: [(size, path) for _, size, path in group]
+            for tid, group in itertools.groupby(file_cursor, key=itemgetter(0))
+        }
+
         for tid, name, total_size in torrents:
             scanned += 1
 
@@ -199,12 +234,7 @@ def get_sample_torrents(conn: sqlite3.Connection, limit_per_scan: int = 50000) -
             if all_full:
                 break
 
-            # Get files for this torrent
-            file_cursor = conn.execute("""
-                SELECT size, path FROM files WHERE torrent_id = ? ORDER BY path
-            """, (tid,))
-            files = file_cursor.fetchall()
-
+            files = files_by_tid.get(tid)
             if not files:
                 continue
 
@@ -268,9 +298,8 @@ def main():
 
     # Write output
     OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        for sample in all_samples:
-            f.write(json.dumps(sample, ensure_ascii=False) + '\n')
+    with open(OUTPUT_FILE, 'wb', buffering=1 << 20) as f:
+        f.writelines(_dumps_line(sample) for sample in all_samples)
 
     print(f"\nWrote {len(all_samples):,} samples to {OUTPUT_FILE}")
 
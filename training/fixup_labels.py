@@ -20,20 +20,39 @@ SHORTCUTS = {
 }
 
 
+LABEL_COLUMNS = ("qwen", "gemma", "mistral", "qwen3coder")
+
+
+def ensure_label_indexes(conn):
+    """Create partial per-classifier indexes so the invalid-label scan only
+    touches labeled rows instead of the whole table."""
+    for col in LABEL_COLUMNS:
+        conn.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_samples_{col}
+            ON samples({col}) WHERE {col} IS NOT NULL
+        """)
+    conn.commit()
+
+
 def get_samples_with_invalid_labels(conn):
     """Get all samples that have at least one invalid label."""
     c = conn.cursor()
 
-    query = """
+    # Valid categories are bound as parameters so SQLite caches one plan
+    # regardless of the category set.
+    valid = sorted(VALID_CATEGORIES)
+    placeholders = ','.join('?' * len(valid))
+    clauses = ' OR '.join(
+        f"({col} IS NOT NULL AND {col} NOT IN ({placeholders}))"
+        for col in LABEL_COLUMNS
+    )
+    query = f"""
     SELECT id, name, files_json, qwen, gemma, mistral, qwen3coder
     FROM samples
-    WHERE (qwen IS NOT NULL AND qwen NOT IN ('music','video','software','book','porn','other'))
-       OR (gemma IS NOT NULL AND gemma NOT IN ('music','video','software','book','porn','other'))
-       OR (mistral IS NOT NULL AND mistral NOT IN ('music','video','software','book','porn','other'))
-       OR (qwen3coder IS NOT NULL AND qwen3coder NOT IN ('music','video','software','book','porn','other'))
+    WHERE {clauses}
     ORDER BY id
     """
-    return c.execute(query).fetchall()
+    return c.execute(query, valid * len(LABEL_COLUMNS)).fetchall()
 
 
 def get_invalid_columns(qwen, gemma, mistral, qwen3coder):
@@ -45,32 +64,22 @@ def get_invalid_columns(qwen, gemma, mistral, qwen3coder):
     return invalid
 
 
-def fix_sample(conn, sample_id, new_label):
-    """Set all invalid labels for this sample to the new label."""
-    c = conn.cursor()
-
-    # Get current values
-    row = c.execute(
-        "SELECT qwen, gemma, mistral, qwen3coder FROM samples WHERE id = ?",
-        (sample_id,)
-    ).fetchone()
-
-    qwen, gemma, mistral, qwen3coder = row
-    updates = []
-
-    for col, val in [("qwen", qwen), ("gemma", gemma), ("mistral", mistral), ("qwen3coder", qwen3coder)]:
-        if val is not None and val not in VALID_CATEGORIES:
-            updates.append(col)
-
-    for col in updates:
-        c.execute(f"UPDATE samples SET {col} = ? WHERE id = ?", (new_label, sample_id))
-
-    conn.commit()
+def fix_sample(conn, sample_id, new_label, invalid_cols):
+    """Set the given invalid label columns for this sample to the new label."""
+    # The caller already knows which columns are invalid, so no re-read is
+    # needed; `with conn:` wraps all updates in a single transaction.
+    updates = [col for col, _ in invalid_cols]
+    with conn:
+        for col in updates:
+            conn.execute(f"UPDATE samples SET {col} = ? WHERE id = ?", (new_label, sample_id))
     return updates
 
 
 def main():
     conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    ensure_label_indexes(conn)
 
     print("=" * 60)
     print("INVALID LABEL FIXUP TOOL (per-sample)")
@@ -134,7 +143,7 @@ def main():
 
             if choice in SHORTCUTS and SHORTCUTS[choice] in VALID_CATEGORIES:
                 new_label = SHORTCUTS[choice]
-                updated_cols = fix_sample(conn, sid, new_label)
+                updated_cols = fix_sample(conn, sid, new_label, invalid_cols)
                 print(f"  Fixed {', '.join(updated_cols)} -> {new_label}")
                 fixed += 1
                 break
@@ -26,13 +26,29 @@ Usage:
 """
 
 import argparse
+import asyncio
+import hashlib
+import heapq
 import json
+import queue
 import sqlite3
-import urllib.request
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
 import time
-from collections import Counter
+
+import aiohttp
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 # =============================================================================
 # CONFIGURATION
@@ -48,6 +64,17 @@ STRIX_HALO_URL = "http://192.168.1.102:8080"      # Strix Halo - big model
 # New 5-class categories (medium type only)
 CATEGORIES = ["audio", "video", "software", "book", "other"]
 
+# Prompts per request on the llama.cpp (OpenAI-compat) endpoint, which
+# accepts an array of prompts and batches them server-side
+OPENAI_BATCH_SIZE = 32
+
+# Shared keep-alive connection pool: one TCP handshake per worker instead of
+# one per classification request
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+
 # Map old 6-class to new 5-class
 OLD_TO_NEW = {
     "music": "audio",
@@ -77,24 +104,48 @@ NORMALIZE_MAP = {
     "application": "software", "app": "software",
 }
 
+# Exact-match fast path: categories map to themselves, aliases to categories
+_ALIAS_TABLE = {**{c: c for c in CATEGORIES}, **NORMALIZE_MAP}
+
+# Substring search over all aliases in one C-level automaton pass instead of
+# one Python `in` scan per alias; optional, with the scan loop as fallback
+try:
+    import ahocorasick
+    _ALIAS_AUTOMATON = ahocorasick.Automaton()
+    for _key, _val in _ALIAS_TABLE.items():
+        _ALIAS_AUTOMATON.add_word(_key, _val)
+    _ALIAS_AUTOMATON.make_automaton()
+except ImportError:
+    _ALIAS_AUTOMATON = None
+
 # =============================================================================
 # UTILITIES
 # =============================================================================
 
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB', 'PB')
+
+
 def human_size(n):
-    for u in ['B', 'KB', 'MB', 'GB', 'TB']:
-        if n < 1024:
-            return f'{n:.1f}{u}'
-        n /= 1024
-    return f'{n:.1f}PB'
+    # bit_length picks the unit in pure integer ops; one division total
+    # instead of up to five (called per file per prompt)
+    if n < 1:
+        return '0.0B'
+    unit = min((int(n).bit_length() - 1) // 10, 5)
+    return f'{n / (1 << (unit * 10)):.1f}{_SIZE_UNITS[unit]}'
 
 
 def normalize_response(response):
     """Normalize LLM response to valid category."""
     response = response.strip().lower()
 
-    if response in CATEGORIES:
-        return response
+    exact = _ALIAS_TABLE.get(response)
+    if exact is not None:
+        return exact
+
+    if _ALIAS_AUTOMATON is not None:
+        for _, cat in _ALIAS_AUTOMATON.iter(response):
+            return cat
+        return None
 
     for key, val in NORMALIZE_MAP.items():
         if key in response:
@@ -107,34 +158,31 @@ def normalize_response(response):
     return None
 
 
-def convert_old_label(old_label):
-    """Convert old 6-class label to new 5-class. Returns None if can't convert."""
-    if old_label is None:
-        return None
-    old_label = old_label.lower().strip()
-    if old_label in OLD_TO_NEW:
-        return OLD_TO_NEW[old_label]
-    # Check if it's already a valid new category
-    if old_label in CATEGORIES:
-        return old_label
-    return None
+def old_label_case(col):
+    """SQL CASE converting an old 6-class label column to new 5-class.
+
+    Mirrors the OLD_TO_NEW mapping (porn becomes NULL), passes through
+    labels that are already valid new categories, and yields NULL for
+    anything unrecognized.
+    """
+    whens = []
+    for old, new in OLD_TO_NEW.items():
+        whens.append(f"WHEN '{old}' THEN " + (f"'{new}'" if new else "NULL"))
+    for cat in CATEGORIES:
+        if cat not in OLD_TO_NEW:
+            whens.append(f"WHEN '{cat}' THEN '{cat}'")
+    return f"CASE lower(trim({col})) {' '.join(whens)} ELSE NULL END"
 
 
 # =============================================================================
 # PROMPT CONSTRUCTION
 # =============================================================================
 
-def build_prompt(name, files_json):
-    """Build classification prompt with top 3 largest files."""
-    files = json.loads(files_json) if files_json else []
-    files_sorted = sorted(files, key=lambda x: x[0], reverse=True)[:3]
-
-    files_str = "\n".join(
-        f"  {Path(path).name} ({human_size(size)})"
-        for size, path in files_sorted
-    )
-
-    return f"""Classify this torrent by MEDIUM TYPE. Reply with exactly one word: audio, video, software, book, or other
+# The instruction block is a verbatim module constant so every prompt shares
+# an identical prefix: the server's KV cache (llama.cpp cache_prompt, Ollama's
+# prompt cache) then skips prefill on it and only processes the short tail.
+# Never interpolate anything into this prefix.
+PROMPT_PREFIX = """Classify this torrent by MEDIUM TYPE. Reply with exactly one word: audio, video, software, book, or other
 
 Note:
 - "audio" = music, podcasts, audiobooks, sound files
@@ -143,7 +191,24 @@ Note:
 - "book" = ebooks, comics, manga, PDFs, documents
 - "other" = images, archives, data, mixed content
 
-Torrent: {name}
+"""
+
+
+# Cached: every cascade stage and model rebuilds the same prompt for the
+# same (name, files_json) row, and nlargest picks the top 3 in one O(n)
+# pass instead of sorting the whole file list
+@lru_cache(maxsize=65536)
+def build_prompt(name, files_json):
+    """Build classification prompt with top 3 largest files."""
+    files = _json_loads(files_json) if files_json else []
+    files_sorted = heapq.nlargest(3, files, key=itemgetter(0))
+
+    files_str = "\n".join(
+        f"  {Path(path).name} ({human_size(size)})"
+        for size, path in files_sorted
+    )
+
+    return f"""{PROMPT_PREFIX}Torrent: {name}
 Top files:
 {files_str}
 
@@ -154,25 +219,31 @@ Medium type:"""
 # LLM CLASSIFICATION
 # =============================================================================
 
+# llama.cpp GBNF grammar constraining decode to exactly one category word;
+# Ollama gets the equivalent constraint via its structured-output schema
+CATEGORY_GRAMMAR = "root ::= " + " | ".join(f'"{c}"' for c in CATEGORIES)
+
+
 def classify_ollama(prompt, model_name, timeout=60):
     """Classify using Ollama API (RTX)."""
-    data = json.dumps({
+    payload = {
         "model": model_name,
         "prompt": prompt,
         "stream": False,
-        "options": {"temperature": 0.0, "num_predict": 20, "num_ctx": 2048}
-    }).encode()
+        # Constrained decoding: the sampler can only emit a category, so
+        # decode stops after a couple of tokens and never produces garbage
+        "format": {"type": "string", "enum": CATEGORIES},
+        # One word is all we need: decode cost is linear in generated
+        # tokens, so cap at 3 and stop at the first delimiter
+        "options": {"temperature": 0.0, "num_predict": 3, "num_ctx": 512,
+                    "stop": ["\n", ",", "."], "cache_prompt": True}
+    }
 
     try:
-        req = urllib.request.Request(
-            f"{RTX_OLLAMA_URL}/api/generate",
-            data=data,
-            headers={"Content-Type": "application/json"}
-        )
         start = time.time()
-        with urllib.request.urlopen(req, timeout=timeout) as r:
-            result = json.loads(r.read())
-            response = result.get("response", "").strip().lower()
+        r = SESSION.post(f"{RTX_OLLAMA_URL}/api/generate", json=payload, timeout=timeout)
+        result = r.json()
+        response = result.get("response", "").strip().lower()
         elapsed = time.time() - start
 
         normalized = normalize_response(response)
@@ -185,22 +256,50 @@ def classify_ollama(prompt, model_name, timeout=60):
 
 def classify_openai(prompt, model_name=None, timeout=60):
     """Classify using OpenAI API (Strix Halo)."""
-    data = json.dumps({
+    payload = {
         "prompt": prompt,
-        "max_tokens": 10,
-        "temperature": 0.0
-    }).encode()
+        "max_tokens": 3,
+        "temperature": 0.0,
+        "stop": ["\n"],
+        "grammar": CATEGORY_GRAMMAR,
+        "cache_prompt": True
+    }
+
+    try:
+        start = time.time()
+        r = SESSION.post(f"{STRIX_HALO_URL}/v1/completions", json=payload, timeout=timeout)
+        result = r.json()
+        response = result.get("choices", [{}])[0].get("text", "").strip().lower()
+        elapsed = time.time() - start
+
+        normalized = normalize_response(response)
+        if normalized:
+            return normalized, elapsed
+        return f"?({response[:20]})", elapsed
+    except Exception as e:
+        return f"ERR({str(e)[:15]})", 0.0
+
+
+async def classify_ollama_async(session, prompt, model_name, timeout=60):
+    """Classify using Ollama API (RTX) over a shared aiohttp session."""
+    payload = {
+        "model": model_name,
+        "prompt": prompt,
+        "stream": False,
+        "format": {"type": "string", "enum": CATEGORIES},
+        "options": {"temperature": 0.0, "num_predict": 3, "num_ctx": 512,
+                    "stop": ["\n", ",", "."], "cache_prompt": True}
+    }
 
     try:
-        req = urllib.request.Request(
-            f"{STRIX_HALO_URL}/v1/completions",
-            data=data,
-            headers={"Content-Type": "application/json"}
-        )
         start = time.time()
-        with urllib.request.urlopen(req, timeout=timeout) as r:
-            result = json.loads(r.read())
-            response = result.get("choices", [{}])[0].get("text", "").strip().lower()
+        async with session.post(
+            f"{RTX_OLLAMA_URL}/api/generate",
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as r:
+            result = await r.json()
+        response = result.get("response", "").strip().lower()
         elapsed = time.time() - start
 
         normalized = normalize_response(response)
@@ -211,6 +310,159 @@ def classify_openai(prompt, model_name=None, timeout=60):
         return f"ERR({str(e)[:15]})", 0.0
 
 
+async def classify_openai_batch_async(session, prompts, model_name=None, timeout=120):
+    """Classify a batch of prompts in one request (Strix Halo).
+
+    llama.cpp's /v1/completions accepts an array of prompts and runs them
+    through its continuous batcher, so one HTTP roundtrip labels the whole
+    batch instead of paying request setup per sample.
+    """
+    payload = {
+        "prompt": prompts,
+        "max_tokens": 3,
+        "temperature": 0.0,
+        "stop": ["\n"],
+        "grammar": CATEGORY_GRAMMAR,
+        "cache_prompt": True
+    }
+
+    try:
+        start = time.time()
+        async with session.post(
+            f"{STRIX_HALO_URL}/v1/completions",
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as r:
+            result = await r.json()
+        elapsed = (time.time() - start) / max(len(prompts), 1)
+
+        choices = sorted(result.get("choices", []), key=lambda c: c.get("index", 0))
+        results = []
+        for i in range(len(prompts)):
+            text = choices[i].get("text", "") if i < len(choices) else ""
+            text = text.strip().lower()
+            normalized = normalize_response(text)
+            results.append((normalized if normalized else f"?({text[:20]})", elapsed))
+        return results
+    except Exception as e:
+        return [(f"ERR({str(e)[:15]})", 0.0)] * len(prompts)
+
+
+class AIMDConcurrency:
+    """Latency-aware concurrency window over a semaphore.
+
+    Static worker counts fit neither endpoint: the RTX Ollama server and the
+    Strix Halo box have different concurrency sweet spots, and oversubscribing
+    either one just queues requests server-side and inflates tail latency.
+    Every WINDOW completed requests the observed p99 is compared with the
+    target: under it the window doubles (up to cap), over it the window
+    halves. Shrinking withholds upcoming releases instead of blocking.
+
+    Built on asyncio primitives; everything runs on the event-loop thread,
+    so no lock is needed.
+    """
+
+    WINDOW = 16
+
+    def __init__(self, start=4, cap=32, target=2.0):
+        self.cap = cap
+        self.target = target
+        self.limit = start
+        self._sem = asyncio.Semaphore(start)
+        self._latencies = []
+        self._debt = 0  # permits to swallow while the window shrinks
+
+    async def acquire(self):
+        await self._sem.acquire()
+
+    def release(self, latency=None):
+        if latency is not None and latency > 0:
+            self._latencies.append(latency)
+            if len(self._latencies) >= self.WINDOW:
+                self._adjust()
+        if self._debt > 0:
+            self._debt -= 1
+            return
+        self._sem.release()
+
+    def _adjust(self):
+        ordered = sorted(self._latencies)
+        self._latencies = []
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        if p99 < self.target and self.limit < self.cap:
+            grown = min(self.limit * 2, self.cap)
+            for _ in range(grown - self.limit):
+                self._sem.release()
+            self.limit = grown
+        elif p99 > self.target and self.limit > 1:
+            shrunk = max(self.limit // 2, 1)
+            self._debt += self.limit - shrunk
+            self.limit = shrunk
+
+
+class SemanticCache:
+    """Embedding cache that reuses labels of near-duplicate prompts.
+
+    Torrent names often differ only by a release tag or resolution; their
+    prompts embed almost identically. Each prompt is embedded once with a
+    small local model, and when the nearest cached vector clears the cosine
+    threshold its label is reused without an LLM call. Only sound because
+    classification runs at temperature 0.
+    """
+
+    DIM = 384  # all-MiniLM-L6-v2
+
+    def __init__(self, path, threshold=0.93):
+        # Heavy import kept local so the labeler starts fast without the flag
+        from sentence_transformers import SentenceTransformer
+        self.encoder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+        self.path = Path(path)
+        self.threshold = threshold
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._labels = []
+        self._buf = np.empty((1024, self.DIM), dtype=np.float32)
+        if self.path.exists():
+            data = np.load(self.path)
+            vectors = data["vectors"]
+            self._labels = [str(l) for l in data["labels"]]
+            self._buf = np.empty((max(1024, len(self._labels) * 2), self.DIM),
+                                 dtype=np.float32)
+            self._buf[:len(self._labels)] = vectors
+
+    def embed(self, prompt):
+        return self.encoder.encode([prompt], normalize_embeddings=True)[0].astype(np.float32)
+
+    def lookup(self, vec):
+        """Return the cached label of the closest prompt, or None."""
+        with self._lock:
+            n = len(self._labels)
+            if n == 0:
+                return None
+            sims = self._buf[:n] @ vec
+            i = int(sims.argmax())
+            if sims[i] >= self.threshold:
+                self.hits += 1
+                return self._labels[i]
+        return None
+
+    def add(self, vec, label):
+        with self._lock:
+            n = len(self._labels)
+            if n == len(self._buf):
+                grown = np.empty((n * 2, self.DIM), dtype=np.float32)
+                grown[:n] = self._buf
+                self._buf = grown
+            self._buf[n] = vec
+            self._labels.append(label)
+
+    def save(self):
+        with self._lock:
+            n = len(self._labels)
+            np.savez_compressed(self.path, vectors=self._buf[:n],
+                                labels=np.array(self._labels))
+
+
 # =============================================================================
 # DATABASE OPERATIONS
 # =============================================================================
@@ -220,7 +472,17 @@ def init_new_db():
     NEW_DB.parent.mkdir(parents=True, exist_ok=True)
 
     conn = sqlite3.connect(NEW_DB)
+    # page_size only takes effect before the first table is created
+    conn.execute("PRAGMA page_size=8192")
     conn.execute("PRAGMA journal_mode=WAL")
+    # Wait out writer-thread commits in SQLite's busy handler instead of
+    # surfacing SQLITE_BUSY to the caller
+    conn.execute("PRAGMA busy_timeout=5000")
+    # Consensus, cascade selection and stats all sweep the samples table;
+    # mmap plus a bigger page cache keep it resident after the first pass
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA temp_store=MEMORY")
     conn.execute("""
         CREATE TABLE IF NOT EXISTS samples (
             id INTEGER PRIMARY KEY,
@@ -247,10 +509,111 @@ def init_new_db():
         )
     """)
     conn.execute("CREATE INDEX IF NOT EXISTS idx_medium ON samples(medium)")
+    # Partial indexes matching the cascade-selection predicates exactly, so
+    # those sweeps become index range scans instead of full table scans
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_need_mistral ON samples(id)
+        WHERE new_qwen IS NOT NULL AND new_gemma IS NOT NULL
+        AND new_mistral IS NULL AND medium IS NULL
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_need_big ON samples(id)
+        WHERE new_qwen IS NOT NULL AND new_gemma IS NOT NULL
+        AND new_mistral IS NOT NULL AND new_big IS NULL AND medium IS NULL
+    """)
+    # Same for label_with_model's per-column "still unlabeled" sweeps
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_null_new_qwen ON samples(id) WHERE new_qwen IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_null_new_gemma ON samples(id) WHERE new_gemma IS NULL")
+    # Response cache: identical (model, prompt) pairs recur across cascade
+    # stages and reruns, so their labels are looked up instead of re-inferred
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cache (
+            prompt_hash TEXT PRIMARY KEY,
+            model TEXT,
+            label TEXT,
+            elapsed REAL
+        )
+    """)
     conn.commit()
     return conn
 
 
+# Writer batching: amortize one fsync over this many row updates, or flush
+# after this long, whichever comes first
+WRITE_BATCH_SIZE = 256
+WRITE_FLUSH_INTERVAL = 2.0
+
+
+def batched_writer(update_sql, result_queue):
+    """Drain result tuples from the queue and apply them in batched
+    transactions on a dedicated connection. A None item shuts it down."""
+    conn = sqlite3.connect(NEW_DB)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA wal_autocheckpoint=1000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+    pending = []
+    last_flush = time.time()
+    done = False
+    while not done:
+        try:
+            item = result_queue.get(timeout=WRITE_FLUSH_INTERVAL)
+            if item is None:
+                done = True
+            else:
+                pending.append(item)
+        except queue.Empty:
+            pass
+
+        now = time.time()
+        if pending and (len(pending) >= WRITE_BATCH_SIZE or done or
+                        now - last_flush >= WRITE_FLUSH_INTERVAL):
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(update_sql, pending)
+            conn.commit()
+            pending = []
+            last_flush = now
+
+    conn.close()
+
+
+def start_batched_writer(update_sql):
+    """Start the writer thread; returns (queue, thread). Callers put
+    parameter tuples for update_sql and a final None, then join."""
+    result_queue = queue.Queue(maxsize=1000)
+    thread = threading.Thread(
+        target=batched_writer, args=(update_sql, result_queue), daemon=True
+    )
+    thread.start()
+    return result_queue, thread
+
+
+def prompt_cache_key(model_name, prompt):
+    """Stable content hash identifying one (model, prompt) pair."""
+    return hashlib.blake2b(f"{model_name}|{prompt}".encode(), digest_size=16).hexdigest()
+
+
+def load_response_cache(conn, model_name):
+    """Load cached labels for a model as {prompt_hash: label}."""
+    cursor = conn.execute(
+        "SELECT prompt_hash, label FROM cache WHERE model = ?", (model_name,)
+    )
+    return dict(cursor.fetchall())
+
+
+def save_response_cache(conn, model_name, entries):
+    """Persist new (prompt_hash, label, elapsed) tuples for a model."""
+    if not entries:
+        return
+    conn.executemany(
+        "INSERT OR IGNORE INTO cache (prompt_hash, model, label, elapsed) VALUES (?, ?, ?, ?)",
+        [(key, model_name, label, elapsed) for key, label, elapsed in entries]
+    )
+    conn.commit()
+
+
 def copy_from_old_db(conn):
     """Copy samples from old DB and convert labels."""
     # Check if already populated
@@ -259,81 +622,207 @@ def copy_from_old_db(conn):
         print(f"New DB already has {count} samples")
         return
 
-    old_conn = sqlite3.connect(OLD_DB)
-    cursor = old_conn.execute("""
-        SELECT id, name, files_json, total_size, qwen, gemma, mistral, qwen3coder
-        FROM samples
-    """)
-
-    inserted = 0
-    for row in cursor:
-        sid, name, files_json, total_size, qwen, gemma, mistral, qwen3coder = row
-
-        # Convert old labels to new 5-class
-        old_qwen = convert_old_label(qwen)
-        old_gemma = convert_old_label(gemma)
-        old_mistral = convert_old_label(mistral)
-        old_qwen3coder = convert_old_label(qwen3coder)
-
-        conn.execute("""
+    # One ATTACH + INSERT...SELECT moves the whole table inside the engine;
+    # the CASE expressions apply the old->new label mapping per column
+    # without a Python round-trip per row
+    cases = ",\n                   ".join(
+        old_label_case(col) for col in ("qwen", "gemma", "mistral", "qwen3coder")
+    )
+    conn.execute("ATTACH DATABASE ? AS old", (str(OLD_DB),))
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.execute(f"""
             INSERT INTO samples (id, name, files_json, total_size,
                                  old_qwen, old_gemma, old_mistral, old_qwen3coder)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (sid, name, files_json, total_size,
-              old_qwen, old_gemma, old_mistral, old_qwen3coder))
-        inserted += 1
+            SELECT id, name, files_json, total_size,
+                   {cases}
+            FROM old.samples
+        """)
+        inserted = cursor.rowcount
+        conn.commit()
+    finally:
+        conn.execute("DETACH DATABASE old")
+    print(f"Copied {inserted} samples from old DB")
 
+
+async def _label_rows_async(cursor, total, result_queue, model_name, cache,
+                            new_cache_entries, semantic_cache, workers,
+                            use_openai, start):
+    """Fan LLM calls out as coroutines on one event loop.
+
+    Each in-flight request is a coroutine instead of an OS thread, so
+    concurrency scales without per-thread stacks or GIL churn on response
+    parsing. Rows stream off the cursor into a bounded task set, the AIMD
+    window throttles actual LLM calls, and results are handed to the
+    writer thread via asyncio.to_thread so a full queue never blocks the
+    loop. Returns the number of completed samples.
+    """
+    completed = 0
+    in_flight = AIMDConcurrency(start=workers)
+
+    async def handle(sid, label, elapsed, key):
+        nonlocal completed
+        if key is not None and label in CATEGORIES:
+            cache[key] = label
+            new_cache_entries.append((key, label, elapsed))
+        await asyncio.to_thread(result_queue.put, (label, elapsed, sid))
+        completed += 1
+        if completed % 100 == 0:
+            rate = completed / (time.time() - start)
+            remaining = (total - completed) / rate if rate > 0 else 0
+            print(f"    {completed}/{total} ({rate:.1f} req/s, ~{remaining/60:.1f}m left)")
+
+    async def produce(session, batch):
+        pending = []  # (sid, prompt, key, vec) that actually need the LLM
+        for sid, name, files_json in batch:
+            prompt = build_prompt(name, files_json)
+            key = prompt_cache_key(model_name, prompt)
+            cached = cache.get(key)
+            if cached is not None:
+                await handle(sid, cached, 0.0, None)
+                continue
+            vec = None
+            if semantic_cache is not None:
+                # Embedding is CPU-bound; keep it off the event loop
+                vec = await asyncio.to_thread(semantic_cache.embed, prompt)
+                near = semantic_cache.lookup(vec)
+                if near is not None:
+                    await handle(sid, near, 0.0, None)
+                    continue
+            pending.append((sid, prompt, key, vec))
+
+        if not pending:
+            return
+        prompts = [p for _, p, _, _ in pending]
+        await in_flight.acquire()
+        if use_openai:
+            results = await classify_openai_batch_async(session, prompts, model_name)
+        else:
+            results = [await classify_ollama_async(session, p, model_name)
+                       for p in prompts]
+        in_flight.release(max((e for _, e in results), default=None))
+        for (sid, _, key, vec), (label, elapsed) in zip(pending, results):
+            if vec is not None and label in CATEGORIES:
+                semantic_cache.add(vec, label)
+            await handle(sid, label, elapsed, key)
+
+    # The OpenAI-compat endpoint batches prompt arrays server-side; Ollama
+    # takes one prompt per request, so concurrent single-prompt requests
+    # keep its internal batcher fed instead
+    batch_size = OPENAI_BATCH_SIZE if use_openai else 1
+    # Task set bounded past the window cap so memory stays constant no
+    # matter how many samples are pending
+    max_tasks = in_flight.cap * 4
+    tasks = set()
+
+    def spawn(session, batch):
+        task = asyncio.ensure_future(produce(session, batch))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    connector = aiohttp.TCPConnector(limit=in_flight.cap)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        batch = []
+        for row in cursor:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                spawn(session, batch)
+                batch = []
+                if len(tasks) >= max_tasks:
+                    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        if batch:
+            spawn(session, batch)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    return completed
+
+
+def seed_from_old_consensus(conn):
+    """Pre-fill new_qwen/new_gemma where the old labels already decide.
+
+    When 3+ of the 4 converted old labels agree, the two new small models
+    cannot change the outcome (the old votes alone reach the consensus
+    threshold), so their LLM calls would be wasted inference. Seed both new
+    columns with that label; label_with_model then skips these rows via its
+    IS NULL sweep and only genuinely ambiguous samples hit the LLM.
+    """
+    placeholders = ", ".join("?" * len(CATEGORIES))
+    tiebreak = " ".join(f"WHEN '{c}' THEN {i}" for i, c in enumerate(CATEGORIES))
+
+    conn.execute("BEGIN IMMEDIATE")
+    before = conn.total_changes
+    conn.execute(f"""
+        WITH winners AS (
+            SELECT s.id AS sid, (
+                SELECT value FROM json_each(json_array(
+                    s.old_qwen, s.old_gemma, s.old_mistral, s.old_qwen3coder
+                ))
+                WHERE value IN ({placeholders})
+                GROUP BY value
+                HAVING COUNT(*) >= 3
+                ORDER BY COUNT(*) DESC, CASE value {tiebreak} END
+                LIMIT 1
+            ) AS label
+            FROM samples s
+            WHERE s.new_qwen IS NULL AND s.new_gemma IS NULL
+        )
+        UPDATE samples SET
+            new_qwen = winners.label, new_qwen_time = 0.0,
+            new_gemma = winners.label, new_gemma_time = 0.0
+        FROM winners
+        WHERE samples.id = winners.sid AND winners.label IS NOT NULL
+    """, CATEGORIES)
+    seeded = conn.total_changes - before
     conn.commit()
-    old_conn.close()
-    print(f"Copied {inserted} samples from old DB")
+    print(f"Seeded {seeded} samples from old-label consensus")
 
 
-def label_with_model(conn, model_name, col_name, workers=4, use_openai=False):
+def label_with_model(conn, model_name, col_name, workers=4, use_openai=False,
+                     use_semantic_cache=False):
     """Label samples with a single model."""
-    cursor = conn.execute(
-        f"SELECT id, name, files_json FROM samples WHERE {col_name} IS NULL"
-    )
-    rows = cursor.fetchall()
+    total = conn.execute(
+        f"SELECT COUNT(*) FROM samples WHERE {col_name} IS NULL"
+    ).fetchone()[0]
 
-    if not rows:
+    if total == 0:
         print(f"  All samples already labeled with {model_name}")
         return
 
     api_type = "OpenAI (Strix Halo)" if use_openai else "Ollama (RTX)"
-    print(f"  Labeling {len(rows)} samples with {model_name} via {api_type} (workers={workers})...")
+    print(f"  Labeling {total} samples with {model_name} via {api_type} (workers={workers})...")
+    cache = load_response_cache(conn, model_name)
+    if cache:
+        print(f"  Response cache: {len(cache)} entries")
+    # One semantic cache per column: sharing across models would replay one
+    # model's label as another's vote and manufacture consensus
+    semantic_cache = None
+    if use_semantic_cache:
+        semantic_cache = SemanticCache(NEW_DB.parent / f"semantic_cache_{col_name}.npz")
+    new_cache_entries = []
     start = time.time()
-    completed = 0
 
-    def process(row):
-        sid, name, files_json = row
-        prompt = build_prompt(name, files_json)
-        if use_openai:
-            label, elapsed = classify_openai(prompt, model_name)
-        else:
-            label, elapsed = classify_ollama(prompt, model_name)
-        return sid, label, elapsed
+    cursor = conn.execute(
+        f"SELECT id, name, files_json FROM samples WHERE {col_name} IS NULL"
+    )
+    cursor.arraysize = 256
 
-    with ThreadPoolExecutor(max_workers=workers) as ex:
-        futures = {ex.submit(process, row): row for row in rows}
-        for future in as_completed(futures):
-            sid, label, elapsed = future.result()
+    result_queue, writer = start_batched_writer(
+        f"UPDATE samples SET {col_name} = ?, {col_name}_time = ? WHERE id = ?"
+    )
 
-            for attempt in range(10):
-                try:
-                    conn.execute(
-                        f"UPDATE samples SET {col_name} = ?, {col_name}_time = ? WHERE id = ?",
-                        (label, elapsed, sid)
-                    )
-                    conn.commit()
-                    break
-                except sqlite3.OperationalError:
-                    time.sleep(0.1 * (attempt + 1))
+    completed = asyncio.run(_label_rows_async(
+        cursor, total, result_queue, model_name, cache, new_cache_entries,
+        semantic_cache, workers, use_openai, start
+    ))
 
-            completed += 1
-            if completed % 100 == 0:
-                rate = completed / (time.time() - start)
-                remaining = (len(rows) - completed) / rate if rate > 0 else 0
-                print(f"    {completed}/{len(rows)} ({rate:.1f} req/s, ~{remaining/60:.1f}m left)")
+    result_queue.put(None)
+    writer.join()
+
+    save_response_cache(conn, model_name, new_cache_entries)
+    if semantic_cache is not None:
+        semantic_cache.save()
+        print(f"    Semantic cache: {semantic_cache.hits} hits")
 
     elapsed = time.time() - start
     print(f"    Done: {completed} samples in {elapsed:.1f}s ({completed/elapsed:.1f} req/s)")
@@ -350,53 +839,58 @@ def compute_consensus(conn):
 
     If 3+ agree on same label -> consensus
     """
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, old_qwen, old_gemma, old_mistral, old_qwen3coder, new_qwen, new_gemma, new_mistral, new_big FROM samples")
-
-    updated = 0
-    for row in cursor.fetchall():
-        sid = row[0]
-        labels = []
-
-        # Collect all valid labels
-        for label in row[1:]:
-            if label and label in CATEGORIES:
-                labels.append(label)
-
-        medium = None
-        if labels:
-            counts = Counter(labels)
-            most_common = counts.most_common(1)[0]
-            if most_common[1] >= 3:
-                medium = most_common[0]
-
-        conn.execute("UPDATE samples SET medium = ? WHERE id = ?", (medium, sid))
-        updated += 1
-
+    # One UPDATE does the whole tally inside SQLite: json_each unpivots the
+    # 8 label columns of each row, the correlated subquery counts votes and
+    # keeps the majority label when 3+ models agree (NULL otherwise). Ties
+    # break on MIN(key) — json_each's key is the column's position in the
+    # array, so the label first seen in column order wins, exactly like
+    # Counter.most_common over the columns did.
+    placeholders = ", ".join("?" * len(CATEGORIES))
+
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("BEGIN IMMEDIATE")
+    cursor = conn.execute(f"""
+        UPDATE samples SET medium = (
+            SELECT value FROM json_each(json_array(
+                old_qwen, old_gemma, old_mistral, old_qwen3coder,
+                new_qwen, new_gemma, new_mistral, new_big
+            ))
+            WHERE value IN ({placeholders})
+            GROUP BY value
+            HAVING COUNT(*) >= 3
+            ORDER BY COUNT(*) DESC, MIN(key)
+            LIMIT 1
+        )
+    """, CATEGORIES)
+    updated = cursor.rowcount
     conn.commit()
     print(f"Updated consensus for {updated} samples")
 
 
+# One SELECT per cascade with the bare predicate (an indexed range scan via
+# the partial indexes above) instead of collecting ids and interpolating them
+# back into a second query's IN (...) list.
+
 def get_samples_needing_mistral(conn):
     """Get samples that don't have consensus after 2 small models."""
     cursor = conn.execute("""
-        SELECT id FROM samples
+        SELECT id, name, files_json FROM samples
         WHERE new_qwen IS NOT NULL AND new_gemma IS NOT NULL
         AND new_mistral IS NULL
         AND medium IS NULL
     """)
-    return [row[0] for row in cursor.fetchall()]
+    return cursor.fetchall()
 
 
 def get_samples_needing_big(conn):
     """Get samples that don't have consensus after mistral."""
     cursor = conn.execute("""
-        SELECT id FROM samples
+        SELECT id, name, files_json FROM samples
         WHERE new_qwen IS NOT NULL AND new_gemma IS NOT NULL AND new_mistral IS NOT NULL
         AND new_big IS NULL
         AND medium IS NULL
     """)
-    return [row[0] for row in cursor.fetchall()]
+    return cursor.fetchall()
 
 
 def label_cascade_mistral(conn, workers=4):
@@ -404,16 +898,11 @@ def label_cascade_mistral(conn, workers=4):
     # First compute consensus to identify which samples need more labeling
     compute_consensus(conn)
 
-    ids = get_samples_needing_mistral(conn)
-    if not ids:
+    rows = get_samples_needing_mistral(conn)
+    if not rows:
         print("  No samples need mistral labeling")
         return
 
-    cursor = conn.execute(
-        f"SELECT id, name, files_json FROM samples WHERE id IN ({','.join(map(str, ids))})"
-    )
-    rows = cursor.fetchall()
-
     print(f"  Labeling {len(rows)} samples with mistral:7b (cascade)...")
     start = time.time()
     completed = 0
@@ -424,21 +913,15 @@ def label_cascade_mistral(conn, workers=4):
         label, elapsed = classify_ollama(prompt, "mistral:7b")
         return sid, label, elapsed
 
+    result_queue, writer = start_batched_writer(
+        "UPDATE samples SET new_mistral = ?, new_mistral_time = ? WHERE id = ?"
+    )
+
     with ThreadPoolExecutor(max_workers=workers) as ex:
         futures = {ex.submit(process, row): row for row in rows}
         for future in as_completed(futures):
             sid, label, elapsed = future.result()
-
-            for attempt in range(10):
-                try:
-                    conn.execute(
-                        "UPDATE samples SET new_mistral = ?, new_mistral_time = ? WHERE id = ?",
-                        (label, elapsed, sid)
-                    )
-                    conn.commit()
-                    break
-                except sqlite3.OperationalError:
-                    time.sleep(0.1 * (attempt + 1))
+            result_queue.put((label, elapsed, sid))
 
             completed += 1
             if completed % 100 == 0:
@@ -446,6 +929,9 @@ def label_cascade_mistral(conn, workers=4):
                 remaining = (len(rows) - completed) / rate if rate > 0 else 0
                 print(f"    {completed}/{len(rows)} ({rate:.1f} req/s, ~{remaining/60:.1f}m left)")
 
+    result_queue.put(None)
+    writer.join()
+
     elapsed = time.time() - start
     print(f"    Done: {completed} samples in {elapsed:.1f}s ({completed/elapsed:.1f} req/s)")
 
@@ -458,16 +944,11 @@ def label_cascade_big(conn, workers=4):
     # First compute consensus
     compute_consensus(conn)
 
-    ids = get_samples_needing_big(conn)
-    if not ids:
+    rows = get_samples_needing_big(conn)
+    if not rows:
         print("  No samples need big model labeling")
         return
 
-    cursor = conn.execute(
-        f"SELECT id, name, files_json FROM samples WHERE id IN ({','.join(map(str, ids))})"
-    )
-    rows = cursor.fetchall()
-
     print(f"  Labeling {len(rows)} samples with qpt-oss:120b (cascade)...")
     start = time.time()
     completed = 0
@@ -478,21 +959,15 @@ def label_cascade_big(conn, workers=4):
         label, elapsed = classify_openai(prompt)
         return sid, label, elapsed
 
+    result_queue, writer = start_batched_writer(
+        "UPDATE samples SET new_big = ?, new_big_time = ? WHERE id = ?"
+    )
+
     with ThreadPoolExecutor(max_workers=workers) as ex:
         futures = {ex.submit(process, row): row for row in rows}
         for future in as_completed(futures):
             sid, label, elapsed = future.result()
-
-            for attempt in range(10):
-                try:
-                    conn.execute(
-                        "UPDATE samples SET new_big = ?, new_big_time = ? WHERE id = ?",
-                        (label, elapsed, sid)
-                    )
-                    conn.commit()
-                    break
-                except sqlite3.OperationalError:
-                    time.sleep(0.1 * (attempt + 1))
+            result_queue.put((label, elapsed, sid))
 
             completed += 1
             if completed % 100 == 0:
@@ -500,6 +975,9 @@ def label_cascade_big(conn, workers=4):
                 remaining = (len(rows) - completed) / rate if rate > 0 else 0
                 print(f"    {completed}/{len(rows)} ({rate:.1f} req/s, ~{remaining/60:.1f}m left)")
 
+    result_queue.put(None)
+    writer.join()
+
     elapsed = time.time() - start
     print(f"    Done: {completed} samples in {elapsed:.1f}s ({completed/elapsed:.1f} req/s)")
 
@@ -576,6 +1054,8 @@ def main():
         "small2", "qwen", "gemma", "gemma-halo", "mistral-cascade", "big-cascade"
     ], default="small2")
     parser.add_argument("--stats", action="store_true")
+    parser.add_argument("--semantic-cache", action="store_true",
+                        help="Reuse labels of near-duplicate prompts via embeddings")
     args = parser.parse_args()
 
     conn = init_new_db()
@@ -589,19 +1069,26 @@ def main():
         return
 
     if args.model == "small2":
-        label_with_model(conn, "qwen2.5:3b", "new_qwen", args.workers, use_openai=False)
-        label_with_model(conn, "gemma3:4b", "new_gemma", args.workers, use_openai=False)
+        # Rows the old labels already decide never reach the LLM
+        seed_from_old_consensus(conn)
+        label_with_model(conn, "qwen2.5:3b-instruct-q4_K_M", "new_qwen", args.workers, use_openai=False,
+                         use_semantic_cache=args.semantic_cache)
+        label_with_model(conn, "gemma3:4b-it-q4_K_M", "new_gemma", args.workers, use_openai=False,
+                         use_semantic_cache=args.semantic_cache)
         compute_consensus(conn)
 
     elif args.model == "qwen":
-        label_with_model(conn, "qwen2.5:3b", "new_qwen", args.workers, use_openai=False)
+        label_with_model(conn, "qwen2.5:3b-instruct-q4_K_M", "new_qwen", args.workers, use_openai=False,
+                         use_semantic_cache=args.semantic_cache)
 
     elif args.model == "gemma":
-        label_with_model(conn, "gemma3:4b", "new_gemma", args.workers, use_openai=False)
+        label_with_model(conn, "gemma3:4b-it-q4_K_M", "new_gemma", args.workers, use_openai=False,
+                         use_semantic_cache=args.semantic_cache)
 
     elif args.model == "gemma-halo":
         # Run gemma on Strix Halo via OpenAI API
-        label_with_model(conn, "gemma-3-4b-it-Q4_K_M.gguf", "new_gemma", args.workers, use_openai=True)
+        label_with_model(conn, "gemma-3-4b-it-Q4_K_M.gguf", "new_gemma", args.workers,
+                         use_openai=True, use_semantic_cache=args.semantic_cache)
 
     elif args.model == "mistral-cascade":
         label_cascade_mistral(conn, args.workers)